@@ -0,0 +1,280 @@
+import argparse
+import copy
+import gzip
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from sqlalchemy import func
+from sqlalchemy.orm import Session, selectinload
+import models
+
+
+# Arquivo morto de pedidos. Pedidos entregues ou cancelados mais antigos que
+# ORDER_ARCHIVE_AFTER_DAYS saem das tabelas orders/order_items e vão para
+# arquivos locais comprimidos, um por mês (AAAA-MM.json.gz), organizados por
+# coluna. O manifest guarda até onde o arquivo vai e a faixa de ids de cada
+# partição, para que list_orders/get_order consultem o arquivo só quando
+# precisam.
+ARCHIVE_DIR = os.getenv("ORDER_ARCHIVE_DIR", "archive/orders")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ORDER_ARCHIVE_AFTER_DAYS", 365))
+ARCHIVABLE_STATUSES = (models.OrderStatus.DELIVERED, models.OrderStatus.CANCELLED)
+
+ORDER_COLUMNS = ("id", "client_id", "status", "created_at", "total_amount")
+ITEM_COLUMNS = ("order_id", "product_id", "quantity", "unit_price", "category")
+
+
+def _manifest_path() -> str:
+    return os.path.join(ARCHIVE_DIR, "manifest.json")
+
+def _partition_path(month: str) -> str:
+    return os.path.join(ARCHIVE_DIR, f"{month}.json.gz")
+
+def _write_atomic(path: str, data: bytes):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def load_manifest() -> dict:
+    try:
+        mtime = os.path.getmtime(_manifest_path())
+    except OSError:
+        return {"archived_before": None, "partitions": {}}
+    return _load_manifest(mtime)
+
+@lru_cache(maxsize=1)
+def _load_manifest(mtime: float) -> dict:
+    with open(_manifest_path()) as f:
+        return json.load(f)
+
+
+def load_partition(month: str) -> dict:
+    try:
+        mtime = os.path.getmtime(_partition_path(month))
+    except OSError:
+        return {"orders": {c: [] for c in ORDER_COLUMNS}, "items": {c: [] for c in ITEM_COLUMNS}}
+    return _load_partition(month, mtime)
+
+@lru_cache(maxsize=24)
+def _load_partition(month: str, mtime: float) -> dict:
+    with gzip.open(_partition_path(month), "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _to_utc_naive(value: datetime) -> datetime:
+    # created_at é gravado em UTC sem timezone
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def _month_bounds(month: str):
+    start = datetime.fromisoformat(month + "-01")
+    return start, (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+# Índice de uma partição: colunas dos pedidos, posição de cada um por id,
+# created_at já convertido e os itens agrupados por pedido. Fica em cache por
+# (mês, mtime), como a própria partição, e é montado uma vez por versão do
+# arquivo.
+def partition_index(month: str) -> dict:
+    try:
+        mtime = os.path.getmtime(_partition_path(month))
+    except OSError:
+        return {"orders": {c: [] for c in ORDER_COLUMNS}, "positions": {}, "created_at": [], "items": {}, "categories": {}}
+    return _partition_index(month, mtime)
+
+@lru_cache(maxsize=24)
+def _partition_index(month: str, mtime: float) -> dict:
+    partition = _load_partition(month, mtime)
+    items = partition["items"]
+    items_by_order, categories = {}, {}
+    for i, order_id in enumerate(items["order_id"]):
+        items_by_order.setdefault(order_id, []).append(
+            {"product_id": items["product_id"][i], "quantity": items["quantity"][i], "unit_price": items["unit_price"][i]}
+        )
+        categories.setdefault(order_id, set()).add(items["category"][i])
+    orders = partition["orders"]
+    return {
+        "orders": orders,
+        "positions": {order_id: i for i, order_id in enumerate(orders["id"])},
+        "created_at": [datetime.fromisoformat(v) for v in orders["created_at"]],
+        "items": items_by_order,
+        "categories": categories,
+    }
+
+def _response(index: dict, i: int) -> dict:
+    orders = index["orders"]
+    order_id = orders["id"][i]
+    return {
+        **{c: orders[c][i] for c in ORDER_COLUMNS},
+        "items": [dict(item) for item in index["items"].get(order_id, [])],
+    }
+
+
+# Indica se uma consulta que começa em start_date (None: desde o início)
+# alcança pedidos arquivados.
+def reaches_archive(start_date: datetime | None) -> bool:
+    manifest = load_manifest()
+    if manifest["archived_before"] is None or not manifest["partitions"]:
+        return False
+    return start_date is None or \
+        _to_utc_naive(start_date) < datetime.fromisoformat(manifest["archived_before"])
+
+
+# Página de pedidos arquivados no formato de OrderResponse, ordenada por id.
+# Retorna a página e quantos pedidos arquivados passam nos filtros; a contagem
+# só é exata quando a página não foi preenchida (aí o arquivo inteiro foi
+# percorrido), que é quando a listagem continua nas tabelas.
+#
+# As partições são percorridas em ordem de id (min_id do manifest) e a busca
+# para assim que nenhuma partição seguinte pode ter id menor que o último da
+# página. Sem filtros além da data, uma partição inteira antes de skip é pulada
+# só pela contagem do manifest, sem abrir o arquivo.
+def query_orders(
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    order_id: int | None = None,
+    status: str | None = None,
+    client_id: int | None = None,
+    category: str | None = None,
+    skip: int = 0,
+    limit: int = 100,
+):
+    manifest = load_manifest()
+    if manifest["archived_before"] is None or not manifest["partitions"]:
+        return [], 0
+    archived_before = datetime.fromisoformat(manifest["archived_before"])
+    start = _to_utc_naive(start_date) if start_date else None
+    end = min(_to_utc_naive(end_date), archived_before) if end_date else archived_before
+    unfiltered = not (order_id or status or client_id or category)
+
+    partitions = []
+    for month, info in manifest["partitions"].items():
+        month_start, month_end = _month_bounds(month)
+        if (start and month_end <= start) or month_start > end:
+            continue
+        if order_id and not info["min_id"] <= order_id <= info["max_id"]:
+            continue
+        inside = (start is None or start <= month_start) and month_end <= end
+        partitions.append((info["min_id"], info["max_id"], info["count"], month, inside))
+    partitions.sort()
+
+    wanted = skip + limit
+    skipped = 0
+    matches = []  # (id, índice, posição); a resposta só é montada para a página
+    for n, (min_id, max_id, count, month, inside) in enumerate(partitions):
+        if matches and len(matches) >= wanted - skipped and min_id > matches[-1][0]:
+            break
+        next_min = partitions[n + 1][0] if n + 1 < len(partitions) else None
+        if unfiltered and inside and not matches and skipped + count <= skip and \
+                (next_min is None or max_id < next_min):
+            skipped += count
+            continue
+
+        index = partition_index(month)
+        orders = index["orders"]
+        if order_id:
+            candidates = [index["positions"][order_id]] if order_id in index["positions"] else []
+        else:
+            candidates = range(len(orders["id"]))
+        for i in candidates:
+            created_at = index["created_at"][i]
+            if (start and created_at < start) or created_at > end:
+                continue
+            if status and orders["status"][i] != status:
+                continue
+            if client_id and orders["client_id"][i] != client_id:
+                continue
+            if category and category not in index["categories"].get(orders["id"][i], ()):
+                continue
+            matches.append((orders["id"][i], index, i))
+        matches.sort(key=lambda m: m[0])
+        del matches[max(0, wanted - skipped):]
+
+    page = matches[max(0, skip - skipped):]
+    return [_response(index, i) for _, index, i in page], skipped + len(matches)
+
+
+def get_order(order_id: int):
+    for month, info in load_manifest()["partitions"].items():
+        if info["min_id"] <= order_id <= info["max_id"]:
+            index = partition_index(month)
+            if order_id in index["positions"]:
+                return _response(index, index["positions"][order_id])
+    return None
+
+
+def _write_partition(month: str, orders: list):
+    partition = copy.deepcopy(load_partition(month))
+    # reexecutar o job depois de uma falha não duplica pedidos já gravados
+    already = set(partition["orders"]["id"])
+    new_orders = sorted((o for o in orders if o.id not in already), key=lambda o: o.id)
+
+    for order in new_orders:
+        partition["orders"]["id"].append(order.id)
+        partition["orders"]["client_id"].append(order.client_id)
+        partition["orders"]["status"].append(order.status.value)
+        partition["orders"]["created_at"].append(order.created_at.isoformat())
+        partition["orders"]["total_amount"].append(float(order.total_amount or 0))
+        for item in order.items:
+            partition["items"]["order_id"].append(order.id)
+            partition["items"]["product_id"].append(item.product_id)
+            partition["items"]["quantity"].append(item.quantity)
+            partition["items"]["unit_price"].append(float(item.unit_price or 0))
+            partition["items"]["category"].append(item.product.category if item.product else None)
+
+    data = json.dumps(partition, separators=(",", ":")).encode("utf-8")
+    _write_atomic(_partition_path(month), gzip.compress(data))
+    ids = partition["orders"]["id"]
+    return {"min_id": min(ids), "max_id": max(ids), "count": len(ids)}
+
+
+# Move para o arquivo os pedidos finalizados mais antigos que older_than_days.
+# Cada mês é gravado em disco antes de ser removido do banco.
+def archive_orders(db: Session, older_than_days: int = ARCHIVE_AFTER_DAYS) -> dict:
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    candidates = db.query(models.Order).filter(
+        models.Order.created_at < cutoff,
+        models.Order.status.in_(ARCHIVABLE_STATUSES),
+    )
+    month_column = func.date_trunc("month", models.Order.created_at)
+    months = [m for (m,) in candidates.with_entities(month_column).distinct().order_by(month_column)]
+
+    manifest = copy.deepcopy(load_manifest())
+    archived = {}
+    for month_start in months:
+        month = month_start.strftime("%Y-%m")
+        next_month = (month_start.replace(day=28) + timedelta(days=4)).replace(day=1)
+        orders = candidates.filter(
+            models.Order.created_at >= month_start,
+            models.Order.created_at < next_month,
+        ).options(selectinload(models.Order.items)).all()
+
+        manifest["partitions"][month] = _write_partition(month, orders)
+        manifest["archived_before"] = max(manifest["archived_before"] or "", cutoff.isoformat())
+        _write_atomic(_manifest_path(), json.dumps(manifest, indent=2).encode("utf-8"))
+
+        ids = [o.id for o in orders]
+        db.query(models.OrderItem).filter(models.OrderItem.order_id.in_(ids)).delete(synchronize_session=False)
+        db.query(models.Order).filter(models.Order.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        archived[month] = len(ids)
+    return archived
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Arquiva pedidos finalizados antigos.")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        for month, count in archive_orders(db, args.days).items():
+            print(f"{month}: {count} pedidos arquivados")
+    finally:
+        db.close()
@@ -0,0 +1,118 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import models, schemas
+from database import SessionLocal
+from group_commit import GroupCommitter
+from orders import place_order
+
+
+# Compara a vazão de criação de pedidos no caminho atual (uma transação e um
+# commit por pedido) com o group commit em várias janelas de lote.
+# Rode contra um banco de teste: cria produtos, um cliente e pedidos, e apaga
+# tudo no final.
+#
+#   python benchmarks/bench_group_commit.py --orders 2000 --concurrency 32
+
+
+def setup(products: int):
+    db = SessionLocal()
+    client = models.Clients(name="bench", email="bench@bench.local", cpf="000.000.000-00", phone="0", company="bench")
+    db.add(client)
+    items = [
+        models.Products(
+            name=f"bench {i}", desc=f"bench {i}", category="bench",
+            barcode=f"99{i:011d}", sales_price=10, stock=10**9, is_active=True,
+        )
+        for i in range(products)
+    ]
+    db.add_all(items)
+    db.commit()
+    ids = (client.id, [p.id for p in items])
+    db.close()
+    return ids
+
+
+def teardown(client_id: int, product_ids: list):
+    db = SessionLocal()
+    order_ids = [o.id for o in db.query(models.Order.id).filter(models.Order.client_id == client_id)]
+    db.query(models.OrderItem).filter(models.OrderItem.order_id.in_(order_ids)).delete(synchronize_session=False)
+    db.query(models.Order).filter(models.Order.id.in_(order_ids)).delete(synchronize_session=False)
+    db.query(models.Products).filter(models.Products.id.in_(product_ids)).delete(synchronize_session=False)
+    db.query(models.Clients).filter(models.Clients.id == client_id).delete(synchronize_session=False)
+    db.commit()
+    db.close()
+
+
+def make_orders(n: int, client_id: int, product_ids: list) -> list:
+    # pedidos de 1 a 3 itens espalhados pelos produtos, em sua maioria sem conflito entre si
+    return [
+        schemas.OrderCreate(
+            client_id=client_id,
+            status="pendente",
+            items=[{"product_id": product_ids[(i * 7 + k) % len(product_ids)], "quantity": 1} for k in range(1 + i % 3)],
+        )
+        for i in range(n)
+    ]
+
+
+def per_request(order_data):
+    db = SessionLocal()
+    try:
+        place_order(db, order_data)
+        db.commit()
+    finally:
+        db.close()
+
+
+def bench_per_request(orders: list, concurrency: int) -> float:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(per_request, orders))
+    return len(orders) / (time.perf_counter() - start)
+
+
+def bench_group_commit(orders: list, concurrency: int, window_ms: float, max_batch: int) -> tuple:
+    committer = GroupCommitter(SessionLocal, window_ms=window_ms, max_batch=max_batch)
+
+    async def run():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(order_data):
+            async with semaphore:
+                await committer.place(order_data)
+
+        await asyncio.gather(*(one(o) for o in orders))
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    throughput = len(orders) / (time.perf_counter() - start)
+    return throughput, committer.snapshot()["avg_batch_size"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--windows", default="0.5,1,2,5,10")
+    parser.add_argument("--max-batch", type=int, default=64)
+    args = parser.parse_args()
+
+    client_id, product_ids = setup(args.products)
+    try:
+        orders = make_orders(args.orders, client_id, product_ids)
+        print(f"{args.orders} pedidos, concorrência {args.concurrency}")
+        print(f"{'modo':<24}{'pedidos/s':>12}{'lote médio':>12}")
+        print(f"{'por requisição':<24}{bench_per_request(orders, args.concurrency):>12.0f}{1:>12}")
+        for window in (float(w) for w in args.windows.split(",")):
+            throughput, avg_batch = bench_group_commit(orders, args.concurrency, window, args.max_batch)
+            print(f"{f'group commit {window}ms':<24}{throughput:>12.0f}{avg_batch:>12}")
+    finally:
+        teardown(client_id, product_ids)
@@ -0,0 +1,111 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import models, schemas
+from database import SessionLocal
+from orders import place_order, responses_from_rows, snapshot_query
+
+
+# Compara a leitura de pedidos pelo caminho antigo (carrega o pedido, os itens
+# com o produto em join e monta o OrderResponse) com a leitura pelo snapshot
+# (uma consulta por id/faixa e o status encaixado no JSON já pronto).
+# Rode contra um banco de teste: cria produtos, um cliente e pedidos, e apaga
+# tudo no final.
+#
+#   python benchmarks/bench_order_snapshots.py --orders 1000 --items 5
+
+
+def setup(orders: int, items: int):
+    db = SessionLocal()
+    client = models.Clients(name="bench", email="bench-snap@bench.local", cpf="000.000.000-01", phone="0", company="bench")
+    products = [
+        models.Products(
+            name=f"bench {i}", desc=f"bench {i}", category="bench",
+            barcode=f"98{i:011d}", sales_price=10, stock=10**9, is_active=True,
+        )
+        for i in range(items * 4)
+    ]
+    db.add(client)
+    db.add_all(products)
+    db.commit()
+    client_id = client.id
+    product_ids = [p.id for p in products]
+    order_ids = []
+    for i in range(orders):
+        order, _ = place_order(db, schemas.OrderCreate(
+            client_id=client_id,
+            status="pendente",
+            items=[{"product_id": product_ids[(i + k) % len(product_ids)], "quantity": 1} for k in range(items)],
+        ))
+        order_ids.append(order.id)
+        if i % 200 == 0:
+            db.commit()
+    db.commit()
+    db.close()
+    return client_id, product_ids, order_ids
+
+
+def teardown(client_id: int, product_ids: list, order_ids: list):
+    db = SessionLocal()
+    db.query(models.OrderItem).filter(models.OrderItem.order_id.in_(order_ids)).delete(synchronize_session=False)
+    db.query(models.Order).filter(models.Order.id.in_(order_ids)).delete(synchronize_session=False)
+    db.query(models.Products).filter(models.Products.id.in_(product_ids)).delete(synchronize_session=False)
+    db.query(models.Clients).filter(models.Clients.id == client_id).delete(synchronize_session=False)
+    db.commit()
+    db.close()
+
+
+def hydrated_get(db, order_id):
+    order = db.query(models.Order).filter(models.Order.id == order_id).first()
+    return schemas.OrderResponse.model_validate(order, from_attributes=True).model_dump(mode="json")
+
+def snapshot_get(db, order_id):
+    return responses_from_rows(db, [snapshot_query(db).filter(models.Order.id == order_id).first()])[0]
+
+def hydrated_list(db, client_id, page):
+    orders = db.query(models.Order).filter(models.Order.client_id == client_id).limit(page).all()
+    return [schemas.OrderResponse.model_validate(o, from_attributes=True).model_dump(mode="json") for o in orders]
+
+def snapshot_list(db, client_id, page):
+    return responses_from_rows(db, snapshot_query(db).filter(models.Order.client_id == client_id).limit(page).all())
+
+
+def timed(fn, args_list) -> float:
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        for args in args_list:
+            fn(db, *args)
+            db.expunge_all()  # sem cache do identity map entre leituras
+            db.rollback()
+        return (time.perf_counter() - start) / len(args_list) * 1000
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=1000)
+    parser.add_argument("--items", type=int, default=5)
+    parser.add_argument("--page", type=int, default=100)
+    parser.add_argument("--list-rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    client_id, product_ids, order_ids = setup(args.orders, args.items)
+    try:
+        gets = [(order_id,) for order_id in order_ids]
+        lists = [(client_id, args.page)] * args.list_rounds
+        print(f"{args.orders} pedidos com {args.items} itens, página de {args.page}")
+        print(f"{'leitura':<20}{'antigo (ms)':>14}{'snapshot (ms)':>16}{'ganho':>10}")
+        for name, old, new, calls in (
+            ("get_order", hydrated_get, snapshot_get, gets),
+            ("list_orders", hydrated_list, snapshot_list, lists),
+        ):
+            old_ms, new_ms = timed(old, calls), timed(new, calls)
+            print(f"{name:<20}{old_ms:>14.3f}{new_ms:>16.3f}{old_ms / new_ms:>9.1f}x")
+    finally:
+        teardown(client_id, product_ids, order_ids)
@@ -0,0 +1,80 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+from multiprocessing import Pool
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Mede a vazão do server.py com diferentes números de workers. Cada rodada sobe
+# o servidor, dispara requisições por alguns segundos a partir de vários
+# processos clientes e derruba o servidor com SIGTERM.
+# Usa uma rota que não depende do banco, então não precisa de Postgres.
+#
+#   python benchmarks/bench_workers.py --workers 1,2,4 --duration 10
+
+
+def client_loop(args) -> int:
+    url, duration = args
+    done = 0
+    deadline = time.monotonic() + duration
+    with httpx.Client() as client:
+        while time.monotonic() < deadline:
+            if client.get(url).status_code == 200:
+                done += 1
+    return done
+
+
+def wait_ready(url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("servidor não respondeu")
+
+
+def run(workers: int, clients: int, duration: float, port: int, path: str) -> float:
+    env = {
+        **os.environ,
+        "WEB_CONCURRENCY": str(workers),
+        "PORT": str(port),
+        "DB_INIT": "0",
+        "LOG_LEVEL": "warning",
+        # sem limite de taxa/concorrência para medir só o servidor
+        "LIMIT_GLOBAL_CONCURRENCY": "100000",
+        "LIMIT_READS_CONCURRENCY": "100000",
+        "LIMIT_READS_RATE": "0",
+    }
+    server = subprocess.Popen([sys.executable, "server.py"], cwd=ROOT, env=env)
+    url = f"http://127.0.0.1:{port}{path}"
+    try:
+        wait_ready(url)
+        with Pool(clients) as pool:
+            total = sum(pool.map(client_loop, [(url, duration)] * clients))
+        return total / duration
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--clients", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--path", default="/openapi.json")
+    args = parser.parse_args()
+
+    print(f"{'workers':>8}{'req/s':>12}")
+    for workers in (int(w) for w in args.workers.split(",")):
+        rps = run(workers, args.clients, args.duration, args.port, args.path)
+        print(f"{workers:>8}{rps:>12.0f}")
@@ -0,0 +1,321 @@
+import csv
+import json
+import tempfile
+from collections import deque
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import select, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+import models, schemas
+
+
+# Importação em massa de clientes a partir de CSV (com cabeçalho) ou NDJSON.
+# O corpo é lido em streaming e processado em lotes: cada lote faz uma única
+# consulta de duplicados no banco e um único INSERT ... ON CONFLICT DO NOTHING,
+# deixando as constraints unique de email/cpf resolverem corridas.
+# O resultado de cada linha vai para um arquivo temporário e é devolvido em
+# NDJSON, então nem a entrada nem a saída ficam inteiras em memória.
+# Se o INSERT do lote falhar no banco, o lote é refeito linha a linha em
+# savepoints e só as linhas problemáticas voltam como erro.
+BATCH_SIZE = 1000
+CLIENT_FIELDS = ("name", "email", "cpf", "phone", "address", "company")
+
+
+ENCODING_ERROR = "Linha não está em UTF-8 (exporte o arquivo como CSV UTF-8)"
+
+
+def _decode(line: bytes):
+    try:
+        return line.decode("utf-8-sig", errors="strict").rstrip("\r")
+    except UnicodeDecodeError:
+        return None
+
+# Linhas do corpo já decodificadas; None para uma linha que não é UTF-8 válido.
+async def _iter_lines(request: Request):
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield _decode(line)
+    if buffer:
+        yield _decode(buffer)
+
+
+# Alimenta um único csv.reader com as linhas do corpo à medida que chegam. Só
+# registros completos entram na fila, então um campo entre aspas com quebra de
+# linha nunca é cortado no meio. Um registro que passa de MAX_RECORD_LINES
+# linhas ou MAX_RECORD_BYTES vira erro em vez de acumular o resto do arquivo.
+MAX_RECORD_LINES = 50
+MAX_RECORD_BYTES = 64 * 1024
+
+
+# Diz se, ao fim da linha, ainda há um campo entre aspas aberto. Como no
+# csv.reader, só uma aspa no início do campo abre aspas; dentro delas "" é uma
+# aspa literal. Uma aspa solta no meio de um campo (ex.: Loja 5") não conta.
+def _ends_in_quotes(line: str, in_quotes: bool) -> bool:
+    i, field_start = 0, not in_quotes
+    while i < len(line):
+        char = line[i]
+        if in_quotes:
+            if char == '"':
+                if line[i + 1:i + 2] == '"':
+                    i += 1
+                else:
+                    in_quotes = False
+        elif char == '"' and field_start:
+            in_quotes = True
+        field_start = not in_quotes and char == ","
+        i += 1
+    return in_quotes
+
+class _LineFeed:
+    def __init__(self):
+        self.lines = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.lines:
+            raise StopIteration
+        return self.lines.popleft()
+
+
+async def _iter_csv(request: Request):
+    feed = _LineFeed()
+    reader = csv.reader(feed)
+    record, in_quotes, size, line_number, start = [], False, 0, 0, 0
+
+    def rows():
+        try:
+            for values in reader:
+                yield values
+        except csv.Error as e:
+            feed.lines.clear()  # descarta o resto do registro inválido
+            yield f"CSV inválido: {e}"
+
+    async for line in _iter_lines(request):
+        line_number += 1
+        if line is None:
+            # o registro em andamento é perdido junto com a linha inválida
+            yield (start if record else line_number), ENCODING_ERROR
+            record, in_quotes, size = [], False, 0
+            continue
+        if not record:
+            if not line.strip():
+                continue
+            start = line_number
+        record.append(line + "\n")
+        size += len(line)
+        in_quotes = _ends_in_quotes(line, in_quotes)
+        if in_quotes:
+            if len(record) >= MAX_RECORD_LINES or size > MAX_RECORD_BYTES:
+                yield start, f"CSV inválido: registro com aspas não fechadas (linhas {start}-{line_number})"
+                record, in_quotes, size = [], False, 0
+            continue  # campo entre aspas continua na próxima linha
+        feed.lines.extend(record)
+        record, size = [], 0
+        for values in rows():
+            yield start, values
+    if record:
+        feed.lines.extend(record)
+        for values in rows():
+            yield start, values
+
+
+async def _iter_rows(request: Request):
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    line_number = 0
+
+    if content_type == "text/csv":
+        header = None
+        async for line, values in _iter_csv(request):
+            if isinstance(values, str):
+                yield line, values
+            elif header is None:
+                header = [h.strip() for h in values]
+            else:
+                yield line, dict(zip(header, values))
+
+    elif content_type in ("application/x-ndjson", "application/jsonl"):
+        async for line in _iter_lines(request):
+            line_number += 1
+            if line is None:
+                yield line_number, ENCODING_ERROR
+                continue
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except ValueError as e:
+                yield line_number, f"JSON inválido: {e}"
+
+    else:
+        raise HTTPException(
+            status_code=415,
+            detail="Formato não suportado. Use text/csv ou application/x-ndjson",
+        )
+
+
+def _parse_row(line: int, row):
+    if isinstance(row, str):
+        return None, schemas.ClientImportResult(line=line, status="error", detail=row)
+    if not isinstance(row, dict):
+        return None, schemas.ClientImportResult(line=line, status="error", detail="Linha deve ser um objeto")
+    data = {field: row.get(field) for field in CLIENT_FIELDS}
+    if data["address"] == "":
+        data["address"] = None
+    try:
+        # mesmas regras do cadastro individual (inclusive a normalização do CPF) e tamanho das colunas
+        return schemas.ClientImport(**data), None
+    except ValidationError as e:
+        detail = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+        return None, schemas.ClientImportResult(line=line, status="error", detail=detail)
+
+
+def _db_error(e: SQLAlchemyError) -> str:
+    return f"Erro no banco de dados: {getattr(e, 'orig', None) or e}".strip()
+
+
+# INSERT de vários clientes em um comando; retorna email -> id dos inseridos.
+def _insert(db: Session, clients: list) -> dict:
+    inserted = db.execute(
+        pg_insert(models.Clients)
+        .values([{**client.model_dump(), "is_active": True} for client in clients])
+        .on_conflict_do_nothing()
+        .returning(models.Clients.id, models.Clients.email)
+    ).all()
+    return {row.email: row.id for row in inserted}
+
+# Refaz o lote linha a linha, cada uma no seu savepoint, depois de uma falha do
+# INSERT em lote. Retorna os ids inseridos e o erro de cada linha que falhou.
+def _insert_each(db: Session, to_insert: list):
+    ids, errors = {}, {}
+    for line, client in to_insert:
+        try:
+            with db.begin_nested():
+                ids.update(_insert(db, [client]))
+        except SQLAlchemyError as e:
+            errors[line] = _db_error(e)
+    return ids, errors
+
+
+def _process_batch(db: Session, batch: list, seen_emails: set, seen_cpfs: set) -> list:
+    results = {}
+    pending = []
+
+    # duplicados dentro do próprio arquivo
+    for line, client in batch:
+        if client.email in seen_emails or client.cpf in seen_cpfs:
+            results[line] = schemas.ClientImportResult(
+                line=line, status="duplicate", email=client.email, cpf=client.cpf,
+                detail="Duplicado no arquivo",
+            )
+            continue
+        seen_emails.add(client.email)
+        seen_cpfs.add(client.cpf)
+        pending.append((line, client))
+
+    # duplicados já cadastrados: uma consulta para o lote inteiro
+    if pending:
+        emails = [client.email for _, client in pending]
+        cpfs = [client.cpf for _, client in pending]
+        existing = db.execute(
+            select(models.Clients.email, models.Clients.cpf).where(
+                or_(models.Clients.email.in_(emails), models.Clients.cpf.in_(cpfs))
+            )
+        ).all()
+        existing_emails = {row.email for row in existing}
+        existing_cpfs = {row.cpf for row in existing}
+
+        to_insert = []
+        for line, client in pending:
+            if client.email in existing_emails or client.cpf in existing_cpfs:
+                results[line] = schemas.ClientImportResult(
+                    line=line, status="duplicate", email=client.email, cpf=client.cpf,
+                    detail="Email ou CPF já cadastrado",
+                )
+            else:
+                to_insert.append((line, client))
+
+        if to_insert:
+            try:
+                ids = _insert(db, [client for _, client in to_insert])
+                errors = {}
+            except SQLAlchemyError:
+                db.rollback()
+                ids, errors = _insert_each(db, to_insert)
+            for line, client in to_insert:
+                if line in errors:
+                    results[line] = schemas.ClientImportResult(
+                        line=line, status="error", email=client.email, cpf=client.cpf,
+                        detail=errors[line],
+                    )
+                elif client.email in ids:
+                    results[line] = schemas.ClientImportResult(
+                        line=line, status="created", id=ids[client.email],
+                        email=client.email, cpf=client.cpf,
+                    )
+                else:
+                    # inserido por outra requisição entre a checagem e o INSERT
+                    results[line] = schemas.ClientImportResult(
+                        line=line, status="duplicate", email=client.email, cpf=client.cpf,
+                        detail="Email ou CPF já cadastrado",
+                    )
+        try:
+            db.commit()
+        except SQLAlchemyError as e:
+            db.rollback()
+            for line, result in results.items():
+                if result.status == "created":
+                    results[line] = schemas.ClientImportResult(
+                        line=line, status="error", email=result.email, cpf=result.cpf,
+                        detail=_db_error(e),
+                    )
+
+    return [results[line] for line, _ in batch]
+
+
+async def import_clients(request: Request, db: Session) -> StreamingResponse:
+    output = tempfile.SpooledTemporaryFile(max_size=1024 * 1024, mode="w+b")
+    summary = {"created": 0, "duplicate": 0, "error": 0}
+    seen_emails, seen_cpfs = set(), set()
+    batch, failed = [], []
+
+    def write(result: schemas.ClientImportResult):
+        summary[result.status] += 1
+        output.write(result.model_dump_json(exclude_none=True).encode() + b"\n")
+
+    def flush():
+        # mantém a ordem das linhas no resultado
+        processed = _process_batch(db, batch, seen_emails, seen_cpfs) if batch else []
+        for result in sorted(processed + failed, key=lambda r: r.line):
+            write(result)
+        batch.clear()
+        failed.clear()
+
+    async for line, row in _iter_rows(request):
+        client, error = _parse_row(line, row)
+        if error:
+            failed.append(error)
+        else:
+            batch.append((line, client))
+        if len(batch) + len(failed) >= BATCH_SIZE:
+            flush()
+    flush()
+
+    output.write(json.dumps({"summary": summary}).encode() + b"\n")
+    output.seek(0)
+
+    def stream():
+        try:
+            while chunk := output.read(64 * 1024):
+                yield chunk
+        finally:
+            output.close()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import threading
+import zlib
+from collections import OrderedDict
+import brotli
+import msgpack
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+
+
+# Negociação de conteúdo para as listagens grandes: JSON ou MessagePack
+# (Accept), comprimidos com brotli ou gzip (Accept-Encoding) quando o corpo
+# passa de COMPRESS_MIN_SIZE. A compressão é feita em blocos enquanto a
+# resposta é enviada. Páginas marcadas como cacheáveis (catálogo) guardam o
+# corpo comprimido indexado pelo hash do conteúdo, então uma página que não
+# mudou não é comprimida de novo.
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", 1024))
+COMPRESSION_CACHE_SIZE = int(os.getenv("COMPRESSION_CACHE_SIZE", 256))
+CHUNK_SIZE = 64 * 1024
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+# o corpo comprimido é gravado pelo gerador do StreamingResponse, que roda no
+# threadpool, enquanto o loop lê o cache: todo acesso passa pelo lock
+_compressed_cache: OrderedDict = OrderedDict()
+_cache_lock = threading.Lock()
+cache_stats = {"hits": 0, "misses": 0}
+
+
+def _accepted(header: str) -> dict:
+    accepted = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    return accepted
+
+def negotiate_media_type(request: Request) -> str:
+    accepted = _accepted(request.headers.get("accept", ""))
+    for media_type in MSGPACK_MEDIA_TYPES:
+        if accepted.get(media_type, 0) > 0 and accepted[media_type] >= accepted.get(JSON_MEDIA_TYPE, 0):
+            return media_type
+    return JSON_MEDIA_TYPE
+
+def negotiate_encoding(request: Request):
+    accepted = _accepted(request.headers.get("accept-encoding", ""))
+    for coding in ("br", "gzip"):
+        if accepted.get(coding, accepted.get("*", 0)) > 0:
+            return coding
+    return None
+
+
+def _compressor(coding: str):
+    if coding == "br":
+        compressor = brotli.Compressor(quality=5)
+        return compressor.process, compressor.finish
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 gera o formato gzip
+    return compressor.compress, compressor.flush
+
+def _compress_stream(body: bytes, coding: str, cache_key=None):
+    compress, finish = _compressor(coding)
+    parts = []
+    for start in range(0, len(body), CHUNK_SIZE):
+        chunk = compress(body[start:start + CHUNK_SIZE])
+        if chunk:
+            parts.append(chunk)
+            yield chunk
+    chunk = finish()
+    parts.append(chunk)
+    yield chunk
+
+    if cache_key is not None:
+        body = b"".join(parts)
+        with _cache_lock:
+            _compressed_cache[cache_key] = body
+            while len(_compressed_cache) > COMPRESSION_CACHE_SIZE:
+                _compressed_cache.popitem(last=False)
+
+
+# Converte uma lista de objetos do banco em dados prontos para codificar.
+def dump_list(items, schema) -> list:
+    return [schema.model_validate(item, from_attributes=True).model_dump(mode="json") for item in items]
+
+
+def encode_response(request: Request, data, cacheable: bool = False) -> Response:
+    media_type = negotiate_media_type(request)
+    if media_type == JSON_MEDIA_TYPE:
+        body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    else:
+        body = msgpack.packb(data, use_bin_type=True)
+
+    digest = hashlib.sha1(body).hexdigest()
+    coding = negotiate_encoding(request) if len(body) >= COMPRESS_MIN_SIZE else None
+    etag = f'"{digest}{"-" + coding if coding else ""}"'
+    headers = {"ETag": etag, "Vary": "Accept, Accept-Encoding"}
+
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    if coding is None:
+        return Response(body, media_type=media_type, headers=headers)
+
+    headers["Content-Encoding"] = coding
+    cache_key = (digest, media_type, coding) if cacheable else None
+    if cache_key is not None:
+        with _cache_lock:
+            cached = _compressed_cache.get(cache_key)
+            if cached is not None:
+                cache_stats["hits"] += 1
+                _compressed_cache.move_to_end(cache_key)
+            else:
+                cache_stats["misses"] += 1
+        if cached is not None:
+            return Response(cached, media_type=media_type, headers=headers)
+
+    return StreamingResponse(_compress_stream(body, coding, cache_key), media_type=media_type, headers=headers)
+
+
+def snapshot() -> dict:
+    with _cache_lock:
+        return {
+            "entries": len(_compressed_cache),
+            "max_entries": COMPRESSION_CACHE_SIZE,
+            "bytes": sum(len(v) for v in _compressed_cache.values()),
+            **cache_stats,
+        }
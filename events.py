@@ -0,0 +1,232 @@
+import asyncio
+import json
+import logging
+import os
+import select
+import threading
+from fastapi import Request
+from sqlalchemy import text
+
+
+# Feed de alterações de produtos (Server-Sent Events). Cada assinante tem uma
+# fila limitada; se ela encher, o consumidor está lento: a fila é descartada e
+# ele recebe um evento "resync" para recarregar os produtos. Um assinante
+# parado custa só uma corrotina e uma fila vazia, então um worker aguenta
+# milhares de terminais conectados.
+#
+# Com vários workers (EVENTS_FANOUT=1, ligado pelo server.py quando
+# WEB_CONCURRENCY > 1) cada assinante está preso ao processo que atendeu a
+# conexão. O evento publicado depois do commit vai então para o Postgres com
+# NOTIFY, e cada worker escuta o canal com LISTEN numa thread própria e entrega
+# aos seus assinantes. Se a conexão de LISTEN cair, os assinantes do worker
+# recebem "resync" ao reconectar, já que eventos podem ter se perdido.
+QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", 100))
+HEARTBEAT_SECONDS = int(os.getenv("EVENTS_HEARTBEAT_SECONDS", 15))
+FANOUT = os.getenv("EVENTS_FANOUT", "0") == "1"
+CHANNEL = "product_events"
+logger = logging.getLogger("lu_store.events")
+
+
+class Subscriber:
+    __slots__ = ("queue", "categories", "product_ids", "dropped")
+
+    def __init__(self, categories, product_ids):
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.categories = set(categories or ())
+        self.product_ids = set(product_ids or ())
+        self.dropped = 0
+
+
+class ProductEventBroker:
+    def __init__(self):
+        self.unfiltered = set()
+        self.by_category = {}
+        self.by_product = {}
+        self.subscriber_count = 0
+        self.published = 0
+        self.resyncs = 0
+        self.fanout = None
+
+    def subscribe(self, categories=None, product_ids=None) -> Subscriber:
+        subscriber = Subscriber(categories, product_ids)
+        if not subscriber.categories and not subscriber.product_ids:
+            self.unfiltered.add(subscriber)
+        for category in subscriber.categories:
+            self.by_category.setdefault(category, set()).add(subscriber)
+        for product_id in subscriber.product_ids:
+            self.by_product.setdefault(product_id, set()).add(subscriber)
+        self.subscriber_count += 1
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.unfiltered.discard(subscriber)
+        for category in subscriber.categories:
+            self._discard(self.by_category, category, subscriber)
+        for product_id in subscriber.product_ids:
+            self._discard(self.by_product, product_id, subscriber)
+        self.subscriber_count -= 1
+
+    def _discard(self, index: dict, key, subscriber: Subscriber):
+        subscribers = index.get(key)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del index[key]
+
+    # Publica para todos os workers quando o fan-out está ligado; senão entrega direto.
+    def publish(self, event: dict):
+        self.published += 1
+        if self.fanout is None or not self.fanout.notify(event):
+            self.deliver(event)
+
+    def deliver(self, event: dict):
+        targets = set(self.unfiltered)
+        targets.update(self.by_category.get(event.get("category"), ()))
+        targets.update(self.by_product.get(event.get("id"), ()))
+        for subscriber in targets:
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self._resync(subscriber)
+
+    # Manda todos os assinantes recarregarem (eventos podem ter se perdido).
+    def resync_all(self):
+        subscribers = set(self.unfiltered)
+        for index in (self.by_category, self.by_product):
+            for group in index.values():
+                subscribers.update(group)
+        for subscriber in subscribers:
+            self._resync(subscriber)
+
+    def _resync(self, subscriber: Subscriber):
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait({"type": "resync"})
+        subscriber.dropped += 1
+        self.resyncs += 1
+
+    def snapshot(self) -> dict:
+        return {
+            "subscribers": self.subscriber_count,
+            "published": self.published,
+            "resyncs": self.resyncs,
+            "fanout": self.fanout.snapshot() if self.fanout else None,
+        }
+
+
+class PostgresFanout:
+    def __init__(self, engine, broker: ProductEventBroker, loop: asyncio.AbstractEventLoop):
+        self.engine = engine
+        self.broker = broker
+        self.loop = loop
+        self.stopped = threading.Event()
+        self.connected = False
+        self.notified = 0
+        self.received = 0
+        self.reconnects = 0
+        self.thread = threading.Thread(target=self._run, name="events-listen", daemon=True)
+
+    # NOTIFY por uma conexão do pool; retorna False se falhar, para o evento
+    # ao menos chegar aos assinantes deste worker.
+    def notify(self, event: dict) -> bool:
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(text("SELECT pg_notify(:channel, :payload)"),
+                             {"channel": CHANNEL, "payload": json.dumps(event)})
+                conn.commit()
+        except Exception:
+            logger.exception("Falha no NOTIFY do evento de produto")
+            return False
+        self.notified += 1
+        return True
+
+    def _run(self):
+        first = True
+        while not self.stopped.is_set():
+            conn = None
+            try:
+                # conexão dedicada, fora do pool: fica presa no LISTEN enquanto o worker vive
+                args, kwargs = self.engine.dialect.create_connect_args(self.engine.url)
+                conn = self.engine.dialect.connect(*args, **kwargs)
+                conn.autocommit = True
+                conn.cursor().execute(f"LISTEN {CHANNEL}")
+                self.connected = True
+                if not first:
+                    self.reconnects += 1
+                    self.loop.call_soon_threadsafe(self.broker.resync_all)
+                first = False
+                while not self.stopped.is_set():
+                    if not select.select([conn], [], [], HEARTBEAT_SECONDS)[0]:
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notification = conn.notifies.pop(0)
+                        self.received += 1
+                        self.loop.call_soon_threadsafe(self.broker.deliver, json.loads(notification.payload))
+            except Exception:
+                logger.exception("Conexão de LISTEN dos eventos caiu; reconectando")
+                self.stopped.wait(1)
+            finally:
+                self.connected = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def snapshot(self) -> dict:
+        return {
+            "connected": self.connected,
+            "notified": self.notified,
+            "received": self.received,
+            "reconnects": self.reconnects,
+        }
+
+
+broker = ProductEventBroker()
+
+
+# Liga o fan-out entre workers no loop do worker atual (chamado no startup do app).
+def start_fanout(engine):
+    if FANOUT and broker.fanout is None:
+        broker.fanout = PostgresFanout(engine, broker, asyncio.get_running_loop())
+        broker.fanout.start()
+
+def stop_fanout():
+    if broker.fanout is not None:
+        broker.fanout.stop()
+        broker.fanout = None
+
+
+def product_event(op: str, product) -> dict:
+    return {
+        "type": "product",
+        "op": op,
+        "id": product.id,
+        "category": product.category,
+        "stock": product.stock,
+        "sales_price": product.sales_price,
+        "is_active": product.is_active,
+    }
+
+
+async def stream(request: Request, subscriber: Subscriber):
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+    finally:
+        broker.unsubscribe(subscriber)
@@ -0,0 +1,191 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+from database import SessionLocal
+import schemas
+from orders import lock_products, place_order, order_response
+
+
+# Group commit para criação de pedidos. Com GROUP_COMMIT=1 os pedidos
+# concorrentes entram numa fila em memória e uma única thread escritora aplica
+# um lote curto (até GROUP_COMMIT_MAX_BATCH pedidos ou GROUP_COMMIT_WINDOW_MS)
+# em uma só transação, pagando um commit por lote em vez de um por pedido.
+# Cada pedido roda dentro de um savepoint: se falhar, só ele volta atrás e o
+# chamador recebe o próprio erro. Antes de aplicar o lote, os produtos de
+# todos os pedidos são travados de uma vez, em ordem de id: assim dois
+# escritores (vários workers) nunca seguram locks em ordens cruzadas.
+# Um pedido que espera mais que GROUP_COMMIT_TIMEOUT_S ainda na fila é
+# descartado e responde 503 (não foi gravado). Se o lote dele já estava sendo
+# aplicado, a resposta é 504 com resultado desconhecido: o pedido pode ter
+# sido confirmado e não deve ser reenviado às cegas.
+ENABLED = os.getenv("GROUP_COMMIT", "0") == "1"
+WINDOW_MS = float(os.getenv("GROUP_COMMIT_WINDOW_MS", 2))
+MAX_BATCH = int(os.getenv("GROUP_COMMIT_MAX_BATCH", 64))
+TIMEOUT_S = float(os.getenv("GROUP_COMMIT_TIMEOUT_S", 10))
+
+
+class GroupCommitter:
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        window_ms: float = WINDOW_MS,
+        max_batch: int = MAX_BATCH,
+        timeout_s: float = TIMEOUT_S,
+    ):
+        self.session_factory = session_factory
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.timeout = timeout_s
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.orders = 0
+        self.failed = 0
+        self.commit_failures = 0
+        self.timeouts = 0
+        self.unknown = 0
+
+    def _ensure_started(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+                self.thread.start()
+
+    def submit(self, order_data: schemas.OrderCreate) -> Future:
+        self._ensure_started()
+        future = Future()
+        self.queue.put((order_data, future))
+        return future
+
+    # Resultado: (resposta do pedido, eventos de estoque) ou a exceção do pedido.
+    # A sessão da requisição é fechada antes da espera: se ela segurasse a
+    # conexão, os pedidos esperando esgotariam o pool e a thread escritora não
+    # teria conexão para gravar o lote que os libera.
+    async def place(self, order_data: schemas.OrderCreate, db: Session | None = None):
+        if db is not None:
+            db.close()
+        future = self.submit(order_data)
+        try:
+            # shield: o timeout não cancela o future; ele só é cancelado abaixo se ainda estiver na fila
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            if future.cancel():
+                # ainda na fila: a thread escritora vai ignorá-lo, o pedido não foi gravado
+                raise HTTPException(status_code=503, detail="Tempo esgotado aguardando a gravação do pedido")
+            if future.done():
+                return future.result()
+            # já está sendo gravado: pode ser confirmado depois desta resposta
+            self.unknown += 1
+            raise HTTPException(
+                status_code=504,
+                detail="Pedido em gravação, resultado desconhecido. Consulte os pedidos do cliente antes de reenviar",
+            )
+
+    def _collect(self) -> list:
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # marca os pedidos como em execução; os que já expiraram no chamador ficam de fora
+            batch = [item for item in self._collect() if item[1].set_running_or_notify_cancel()]
+            if batch:
+                self._apply(batch)
+
+    # Todo future do lote termina com resultado ou exceção, mesmo que a sessão,
+    # o rollback ou o close falhem; senão o chamador ficaria esperando para sempre.
+    def _apply(self, batch: list):
+        try:
+            outcomes = self._transaction(batch)
+        except Exception as e:
+            self.commit_failures += 1
+            if len(batch) > 1:
+                # o commit do lote falhou: refaz cada pedido isolado para que um não derrube os outros
+                for i, item in enumerate(batch):
+                    try:
+                        self._apply([item])
+                    except BaseException as e:
+                        self._resolve([(future, None, e) for _, future in batch[i + 1:]])
+                        raise
+                return
+            outcomes = [(future, None, e) for _, future in batch]
+        except BaseException as e:
+            self._resolve([(future, None, e) for _, future in batch])
+            raise
+        self.batches += 1
+        self._resolve(outcomes)
+
+    def _transaction(self, batch: list) -> list:
+        db = None
+        try:
+            db = self.session_factory()
+            outcomes = []
+            lock_products(db, (item.product_id for order_data, _ in batch for item in order_data.items))
+            for order_data, future in batch:
+                savepoint = db.begin_nested()
+                try:
+                    order, stock_events = place_order(db, order_data)
+                    response = order_response(order)
+                    savepoint.commit()
+                    outcomes.append((future, (response, stock_events), None))
+                except Exception as e:
+                    savepoint.rollback()
+                    outcomes.append((future, None, e))
+            db.commit()
+            return outcomes
+        except BaseException:
+            if db is not None:
+                try:
+                    db.rollback()
+                except Exception:
+                    pass  # a conexão é descartada no close
+            raise
+        finally:
+            if db is not None:
+                try:
+                    db.close()
+                except Exception:
+                    pass
+
+    def _resolve(self, outcomes: list):
+        for future, result, error in outcomes:
+            self.orders += 1
+            if error is not None:
+                self.failed += 1
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def snapshot(self) -> dict:
+        return {
+            "enabled": ENABLED,
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "queued": self.queue.qsize(),
+            "batches": self.batches,
+            "orders": self.orders,
+            "failed": self.failed,
+            "commit_failures": self.commit_failures,
+            "timeouts": self.timeouts,
+            "unknown_outcomes": self.unknown,
+            "avg_batch_size": round(self.orders / self.batches, 2) if self.batches else 0,
+        }
+
+
+committer = GroupCommitter()
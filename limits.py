@@ -0,0 +1,172 @@
+import os
+import time
+import math
+import database
+
+
+# Controle de admissão por grupo de rotas. Cada grupo tem um limite de
+# requisições simultâneas e um token bucket (taxa por segundo + rajada).
+# Quando o limite estoura a requisição falha na hora (503 ou 429) em vez de
+# ficar na fila disputando o pool do banco e a CPU.
+#
+# Prioridade: todos os grupos dividem um teto global de requisições em voo.
+# Grupos de menor prioridade só podem usar uma fração desse teto, deixando
+# folga reservada para o checkout.
+#
+# Os limites configurados valem para o servidor inteiro. Cada processo guarda
+# o próprio estado, então com WEB_CONCURRENCY workers cada um aplica a sua
+# parte (limite / workers, arredondado para cima). Como o kernel não reparte
+# as conexões de forma exata entre os workers, o total é aproximado.
+# O checkout ainda fica limitado à capacidade do pool de conexões do processo,
+# para que os pedidos em voo nunca disputem mais conexões do que existem.
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, default))
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+def _workers() -> int:
+    try:
+        return max(1, int(os.getenv("WEB_CONCURRENCY", 1)))
+    except ValueError:
+        return 1
+
+def _per_worker(total: int) -> int:
+    return max(1, math.ceil(total / WORKERS))
+
+
+WORKERS = _workers()
+POOL_CAPACITY = database.POOL_SIZE + database.MAX_OVERFLOW
+GLOBAL_MAX_CONCURRENCY = _env_int("LIMIT_GLOBAL_CONCURRENCY", 64)
+
+# grupo: (concorrência, requisições/s, rajada, fração do teto global)
+DEFAULT_GROUPS = {
+    "checkout": (32, 100.0, 200, 1.0),
+    "auth": (8, 20.0, 40, 0.7),
+    "reads": (32, 200.0, 400, 0.8),
+    "reports": (4, 10.0, 20, 0.5),
+    "admin": (8, 20.0, 40, 0.6),
+}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # retorna 0 se o token foi consumido, senão os segundos até o próximo token
+    def take(self) -> float:
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RouteGroupLimiter:
+    def __init__(self, name: str, max_concurrency: int, rate: float, burst: int, share: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.share = share
+        self.bucket = TokenBucket(rate, burst)
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected_concurrency = 0
+        self.rejected_rate = 0
+
+    def snapshot(self) -> dict:
+        self.bucket._refill()
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "global_share": self.share,
+            "rate_per_second": self.bucket.rate,
+            "burst": self.bucket.burst,
+            "tokens_available": round(self.bucket.tokens, 2),
+            "admitted": self.admitted,
+            "rejected_concurrency": self.rejected_concurrency,
+            "rejected_rate": self.rejected_rate,
+        }
+
+
+class Rejection(Exception):
+    def __init__(self, status_code: int, retry_after: int, detail: str):
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.detail = detail
+
+
+class AdmissionController:
+    def __init__(self, global_max: int = GLOBAL_MAX_CONCURRENCY, groups: dict = DEFAULT_GROUPS):
+        self.global_max = _per_worker(global_max)
+        self.in_flight = 0
+        self.groups = {}
+        for name, (concurrency, rate, burst, share) in groups.items():
+            prefix = f"LIMIT_{name.upper()}_"
+            concurrency = _per_worker(_env_int(prefix + "CONCURRENCY", concurrency))
+            if name == "checkout":
+                concurrency = min(concurrency, POOL_CAPACITY)
+            self.groups[name] = RouteGroupLimiter(
+                name,
+                concurrency,
+                _env_float(prefix + "RATE", rate) / WORKERS,
+                _per_worker(_env_int(prefix + "BURST", burst)),
+                _env_float(prefix + "SHARE", share),
+            )
+
+    def acquire(self, group: str):
+        limiter = self.groups[group]
+        if limiter.in_flight >= limiter.max_concurrency or \
+                self.in_flight >= math.ceil(self.global_max * limiter.share):
+            limiter.rejected_concurrency += 1
+            raise Rejection(503, 1, "Servidor sobrecarregado, tente novamente em instantes")
+
+        wait = limiter.bucket.take()
+        if wait:
+            limiter.rejected_rate += 1
+            raise Rejection(429, math.ceil(wait), "Limite de requisições excedido")
+
+        limiter.in_flight += 1
+        limiter.admitted += 1
+        self.in_flight += 1
+
+    def release(self, group: str):
+        self.groups[group].in_flight -= 1
+        self.in_flight -= 1
+
+    def snapshot(self) -> dict:
+        return {
+            "workers": WORKERS,
+            "in_flight": self.in_flight,
+            "global_max_concurrency": self.global_max,
+            "groups": {name: limiter.snapshot() for name, limiter in self.groups.items()},
+        }
+
+
+# Classifica a requisição em um grupo a partir do método e do caminho.
+def classify(method: str, path: str) -> str:
+    if path.startswith("/auth") or path == "/token":
+        return "auth"
+    if path.startswith("/orders"):
+        if method == "POST" or method == "DELETE":
+            return "checkout"
+        if method == "GET" and path.rstrip("/") == "/orders":
+            return "reports"
+    if method in ("GET", "HEAD", "OPTIONS"):
+        return "reads"
+    if path.startswith("/orders"):
+        return "checkout"
+    return "admin"
+
+
+admission = AdmissionController()
@@ -1,14 +1,28 @@
-from fastapi import FastAPI, HTTPException, Depends, status, Query
+from fastapi import FastAPI, HTTPException, Depends, status, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.openapi.utils import get_openapi
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel
 from typing import Optional
+from contextlib import asynccontextmanager
+import os
 from datetime import datetime, timedelta
 from typing import List, Annotated
 import models, schemas
+import client_import
+import encoding
+import archive
+import sync
+import group_commit
+from group_commit import committer
+from orders import place_order, order_response, responses_from_rows, snapshot_query
+from events import broker, product_event
+import events
+from limits import admission, classify, Rejection
+from profiling import RequestProfiler, get_request_profiler
 from database import engine, SessionLocal
 from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy import select, or_
 from sqlalchemy.exc import SQLAlchemyError, NoResultFound
 from sqlalchemy.ext.asyncio import AsyncSession
 from auth import (
@@ -30,13 +44,65 @@ from auth import (
  
 
 
-app = FastAPI()
+#no startup de cada worker liga o fan-out de eventos entre workers (EVENTS_FANOUT=1)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    events.start_fanout(engine)
+    yield
+    events.stop_fanout()
 
-models.Base.metadata.create_all(bind=engine)
+app = FastAPI(lifespan=lifespan)
+
+# Cria as tabelas. No server.py isso é feito uma vez no processo pai (DB_INIT=0 nos workers).
+if os.getenv("DB_INIT", "1") == "1":
+    models.create_schema(engine)
 
 
 db_dependency = Annotated[Session, Depends(get_db)]
 
+BATCH_MAX_IDS = 100
+
+#valida os ids de uma busca em lote, removendo repetidos e mantendo a ordem pedida
+def batch_ids(ids: List[int]) -> List[int]:
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"Máximo de {BATCH_MAX_IDS} ids por busca")
+    return ids
+
+#monta a resposta da busca em lote na ordem dos ids, listando os que não foram encontrados
+def batch_result(ids: List[int], found: dict) -> dict:
+    return {
+        "items": [found[i] for i in ids if i in found],
+        "missing": [i for i in ids if i not in found],
+    }
+
+#controle de admissão: limita concorrência e taxa por grupo de rotas antes de tocar no banco.
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    group = classify(request.method, request.url.path)
+    try:
+        admission.acquire(group)
+    except Rejection as e:
+        return JSONResponse(
+            status_code=e.status_code,
+            content={"detail": e.detail},
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    try:
+        return await call_next(request)
+    finally:
+        admission.release(group)
+
+#estado atual dos limitadores. Somente superusers.
+@app.get("/metrics")
+async def metrics(current_user: models.Users = Depends(get_current_superuser)):
+    return {
+        "admission": admission.snapshot(),
+        "compression_cache": encoding.snapshot(),
+        "events": broker.snapshot(),
+        "group_commit": committer.snapshot(),
+    }
+
 @app.post("/auth/register")
 async def create_user(user: schemas.NewUser, db: db_dependency):
    db_user = db.query(models.Users).filter(models.Users.email == user.email).first()
@@ -118,14 +184,13 @@ async def create_client(
     db: Session = Depends(get_db),
     current_user: models.Users = Depends(get_current_active_user)
 ):
-    # Verifica se email já existe
-    db_email = db.query(models.Clients).filter(models.Clients.email == client.email).first()
-    if db_email:
+    # Verifica se email ou CPF já existem em uma única consulta
+    existing = db.query(models.Clients.email, models.Clients.cpf).filter(
+        or_(models.Clients.email == client.email, models.Clients.cpf == client.cpf)
+    ).all()
+    if any(row.email == client.email for row in existing):
         raise HTTPException(status_code=400, detail="Email já cadastrado")
-    
-    # Verifica se CPF já existe
-    db_cpf = db.query(models.Clients).filter(models.Clients.cpf == client.cpf).first()
-    if db_cpf:
+    if existing:
         raise HTTPException(status_code=400, detail="CPF já cadastrado")
     
     db_client = models.Clients(**client.model_dump())
@@ -134,6 +199,15 @@ async def create_client(
     db.refresh(db_client)
     return db_client
 
+#Importação em massa de clientes (CSV ou NDJSON) com resultado por linha. Somente superusers.
+@app.post("/clients/import")
+async def import_clients(
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: models.Users = Depends(get_current_superuser)
+):
+    return await client_import.import_clients(request, db)
+
 #lista todos os clientes com paginação e filtros opcionais.
 @app.get("/clients")
 async def list_clients(
@@ -142,6 +216,7 @@ async def list_clients(
     name: Optional[str] = Query(None, min_length=1),
     email: Optional[str] = Query(None, min_length=1),
     include_inactive: bool = Query(False, description="Incluir clientes inativos"),
+    updated_since: Optional[datetime] = Query(None, description="Somente clientes alterados a partir desta data"),
     db: Session = Depends(get_db),
     current_user: models.Users = Depends(get_current_active_user)
 ):
@@ -156,11 +231,34 @@ async def list_clients(
         query = query.filter(models.Clients.name.ilike(f"%{name}%"))
     if email:
         query = query.filter(models.Clients.email.ilike(f"%{email}%"))
+    if updated_since:
+        query = query.filter(models.Clients.last_update >= updated_since)
     
     clients = query.offset(skip).limit(limit).all()
     return clients
 
 
+#alterações de clientes desde o token informado (sincronização incremental dos terminais)
+@app.get("/clients/changes", response_model=schemas.ClientChanges)
+async def client_changes(
+    token: Optional[str] = Query(None, description="Token devolvido na sincronização anterior"),
+    limit: int = Query(500, gt=0, le=sync.MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+    current_user: models.Users = Depends(get_current_active_user)
+):
+    return sync.changes_since(db, models.Clients, token, limit)
+
+#busca vários clientes por id em uma única consulta
+@app.get("/clients/batch", response_model=schemas.ClientBatch)
+async def get_clients_batch(
+    ids: List[int] = Query(...),
+    db: Session = Depends(get_db),
+    current_user: models.Users = Depends(get_current_active_user)
+):
+    ids = batch_ids(ids)
+    clients = db.query(models.Clients).filter(models.Clients.id.in_(ids)).all()
+    return batch_result(ids, {c.id: c for c in clients})
+
 #seleciona um cliente especifico utilizando o cliente id
 @app.get("/clients/{client_id}", response_model=schemas.ClientBase)
 async def get_client(
@@ -185,16 +283,15 @@ async def update_client(
     if not db_client:
         raise HTTPException(status_code=404, detail="Cliente não encontrado")
     
-    # Verifica se novo email já existe (outro cliente)
-    if client.email != db_client.email:
-        db_email = db.query(models.Clients).filter(models.Clients.email == client.email).first()
-        if db_email:
+    # Verifica se novo email ou CPF já existem em outro cliente, em uma única consulta
+    if client.email != db_client.email or client.cpf != db_client.cpf:
+        existing = db.query(models.Clients.email, models.Clients.cpf).filter(
+            models.Clients.id != client_id,
+            or_(models.Clients.email == client.email, models.Clients.cpf == client.cpf)
+        ).all()
+        if any(row.email == client.email for row in existing):
             raise HTTPException(status_code=400, detail="Email já cadastrado")
-    
-    # Verifica se novo CPF já existe (outro cliente)
-    if client.cpf != db_client.cpf:
-        db_cpf = db.query(models.Clients).filter(models.Clients.cpf == client.cpf).first()
-        if db_cpf:
+        if existing:
             raise HTTPException(status_code=400, detail="CPF já cadastrado")
     
     for key, value in client.model_dump().items():
@@ -246,11 +343,13 @@ async def create_product(
     db.add(db_product)
     db.commit()
     db.refresh(db_product)
+    broker.publish(product_event("created", db_product))
     return db_product
 
 #rota para exibir produtos com paginação e filtros
 @app.get("/products", response_model=List[schemas.Product])
 async def list_products(
+    request: Request,
     db: AsyncSession = Depends(get_db),
     skip: int = 0,
     limit: int = Query(100, le=1000),  # Limite máximo de 1000 itens
@@ -258,6 +357,7 @@ async def list_products(
     min_price: Optional[float] = Query(None, gt=0, description="Filtro por preço mínimo"),
     max_price: Optional[float] = Query(None, gt=0, description="Filtro por preço máximo"),
     is_active: Optional[bool] = Query(True, description="Filtrar produtos ativos/inativos"),
+    updated_since: Optional[datetime] = Query(None, description="Somente produtos alterados a partir desta data"),
     current_user: models.Users = Depends(get_current_active_user)
 ):
     query = db.query(models.Products)
@@ -274,9 +374,48 @@ async def list_products(
     if max_price:
         query = query.filter(models.Products.sale_price <= max_price)
     
+    if updated_since:
+        query = query.filter(models.Products.last_update >= updated_since)
     
     products = query.offset(skip).limit(limit).all()
-    return products
+    # JSON ou MessagePack, comprimido conforme Accept-Encoding; páginas do catálogo ficam em cache
+    return encoding.encode_response(request, encoding.dump_list(products, schemas.Product), cacheable=True)
+
+#feed de alterações de produtos (SSE), com filtro opcional por categoria e/ou id
+@app.get("/products/events")
+async def product_events(
+    request: Request,
+    category: Optional[List[str]] = Query(None),
+    product_id: Optional[List[int]] = Query(None),
+    current_user: models.Users = Depends(get_current_active_user)
+):
+    subscriber = broker.subscribe(categories=category, product_ids=product_id)
+    return StreamingResponse(
+        events.stream(request, subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+#alterações de produtos desde o token informado (sincronização incremental dos terminais)
+@app.get("/products/changes", response_model=schemas.ProductChanges)
+async def product_changes(
+    token: Optional[str] = Query(None, description="Token devolvido na sincronização anterior"),
+    limit: int = Query(500, gt=0, le=sync.MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+    current_user: models.Users = Depends(get_current_active_user)
+):
+    return sync.changes_since(db, models.Products, token, limit)
+
+#busca vários produtos por id em uma única consulta (ex.: resolver a cesta do checkout)
+@app.get("/products/batch", response_model=schemas.ProductBatch)
+async def get_products_batch(
+    ids: List[int] = Query(...),
+    db: Session = Depends(get_db),
+    current_user: models.Users = Depends(get_current_active_user)
+):
+    ids = batch_ids(ids)
+    products = db.query(models.Products).filter(models.Products.id.in_(ids)).all()
+    return batch_result(ids, {p.id: p for p in products})
 
 #rota para exibir produto especifico
 @app.get("/products/{product_id}", response_model=schemas.Product)
@@ -308,6 +447,7 @@ async def update_product(
     
     db.commit()
     db.refresh(db_product)
+    broker.publish(product_event("updated", db_product))
     return db_product
 
 # v. Excluir produto (soft delete)
@@ -322,7 +462,9 @@ async def delete_product(
         raise HTTPException(status_code=404, detail="Produto não encontrado")
     
     db_product.is_active = False
+    event = product_event("deleted", db_product)
     db.commit()
+    broker.publish(event)
     return {"message": "Produto desativado com sucesso"}
 
 #Cadastro e manipulação de pedidos
@@ -335,58 +477,23 @@ async def create_order(
     current_user: models.Users = Depends(get_current_active_user)
 ):
     try:
-        # Verifica se já existe transação para não causar erro.
-        if db.in_transaction():
-            db.begin_nested()  # Usa savepoint se necessário
+        if group_commit.ENABLED:
+            # o pedido é aplicado pela thread de group commit junto com outros pedidos concorrentes
+            order, stock_events = await committer.place(order_data, db)
         else:
-            db.begin()  # Inicia nova transação apenas se não existir
+            # Verifica se já existe transação para não causar erro.
+            if db.in_transaction():
+                db.begin_nested()  # Usa savepoint se necessário
+            else:
+                db.begin()  # Inicia nova transação apenas se não existir
 
-        order_items = []
-        total_amount = 0
-
-        # Processa itens do pedido
-        for item in order_data.items:
-            product = db.query(models.Products).filter(
-               models.Products.id == item.product_id
-            ).with_for_update().one()  # Lock para evitar race conditions
-
-            if product.stock < item.quantity:
-                db.rollback()
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Estoque insuficiente: {product.desc}"
-                )
-
-            item_total = product.sales_price * item.quantity
-            total_amount += item_total
-            order_items.append({
-                "product": product,
-                "quantity": item.quantity,
-                "unit_price": product.sales_price
-            })
-        # Cria o pedido
-        db_status = convert_order_status(order_data.status)
-        order = models.Order(
-            client_id=order_data.client_id,
-            status=db_status,
-            total_amount=total_amount
-        )
-        db.add(order)
-        db.flush()  # Obtém ID para os itens
-
-        # Adiciona itens e atualiza estoque
-        for item in order_items:
-            db.add(models.OrderItem(
-                order_id=order.id,
-                product_id=item["product"].id,
-                quantity=item["quantity"],
-                unit_price=item["unit_price"]
-            ))
-            item["product"].stock -= item["quantity"]
-
-        db.commit()
-        return order
+            order, stock_events = place_order(db, order_data)
+            order = order_response(order)  # resposta vem do snapshot, sem recarregar o pedido após o commit
+            db.commit()
 
+    except HTTPException:
+        db.rollback()
+        raise
     except SQLAlchemyError as e:
         db.rollback()  # Importante! caso dê erro ele não atualiza o banco.
         raise HTTPException(
@@ -399,10 +506,15 @@ async def create_order(
             status_code=400,
             detail=f"Erro ao processar pedido: {str(e)}"
         )
+
+    for event in stock_events:
+        broker.publish(event)
+    return order
     
 #Lista pedidos utilizando filtros
 @app.get("/orders", response_model=List[schemas.OrderResponse])
 async def list_orders(
+    request: Request,
     db: Session = Depends(get_db),
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
@@ -412,9 +524,11 @@ async def list_orders(
     client_id: Optional[int] = None,
     skip: int = 0,
     limit: int = 100,
-    current_user: models.Users = Depends(get_current_active_user)
+    current_user: models.Users = Depends(get_current_active_user),
+    profiler: Optional[RequestProfiler] = Depends(get_request_profiler)
 ):
-    query = db.query(models.Order)
+    # lê só id, status e o snapshot de cada pedido: sem join nem carga dos itens
+    query = snapshot_query(db)
     
     if start_date:
         query = query.filter(models.Order.created_at >= start_date)
@@ -427,22 +541,62 @@ async def list_orders(
     if client_id:
         query = query.filter(models.Order.client_id == client_id)
     if category:
-        query = query.join(models.Order.items).join(models.OrderItem.product).filter(models.Product.category == category)
-    
-    orders = query.offset(skip).limit(limit).all()
-    return orders    
+        query = query.join(models.Order.items).join(models.OrderItem.product).filter(models.Products.category == category).distinct()
+    
+    # Se o período alcança o arquivo morto (sem start_date, desde o início), os pedidos arquivados vêm primeiro e a paginação continua nas tabelas.
+    archived_count = 0
+    if archive.reaches_archive(start_date):
+        archived, archived_count = archive.query_orders(
+            start_date, end_date, order_id=order_id, status=status.value if status else None,
+            client_id=client_id, category=category, skip=skip, limit=limit,
+        )
+        query = query.order_by(models.Order.id)
+    if archived_count:
+        orders = archived
+        hot_limit = limit - len(orders)
+        if hot_limit > 0:
+            # página incompleta: o arquivo foi percorrido inteiro e archived_count é exato
+            orders += responses_from_rows(db, query.offset(max(0, skip - archived_count)).limit(hot_limit).all())
+    else:
+        orders = responses_from_rows(db, query.offset(skip).limit(limit).all())
+    if profiler:
+        return profiler.respond(orders, schemas.OrderResponse)
+    return encoding.encode_response(request, orders)
+
+#busca vários pedidos por id em uma única consulta
+@app.get("/orders/batch", response_model=schemas.OrderBatch)
+async def get_orders_batch(
+    ids: List[int] = Query(...),
+    db: Session = Depends(get_db),
+    current_user: models.Users = Depends(get_current_active_user)
+):
+    ids = batch_ids(ids)
+    orders = responses_from_rows(db, snapshot_query(db).filter(models.Order.id.in_(ids)).all())
+    found = {o["id"]: o for o in orders}
+    for order_id in ids:
+        if order_id not in found:
+            archived = archive.get_order(order_id)
+            if archived:
+                found[order_id] = archived
+    return batch_result(ids, found)
 
 #pega um pedido especifico
 @app.get("/orders/{order_id}", response_model=schemas.OrderResponse)
 async def get_order(
+    request: Request,
     order_id: int,
     db: Session = Depends(get_db),
-    current_user: models.Users = Depends(get_current_active_user)
+    current_user: models.Users = Depends(get_current_active_user),
+    profiler: Optional[RequestProfiler] = Depends(get_request_profiler)
 ):
-    order = db.query(models.Order).filter(models.Order.id == order_id).first()
+    # leitura pela chave primária; a resposta sai do snapshot com o status atual
+    row = snapshot_query(db).filter(models.Order.id == order_id).first()
+    order = responses_from_rows(db, [row])[0] if row else archive.get_order(order_id)
     if not order:
         raise HTTPException(status_code=404, detail="Pedido não encontrado")
-    return order
+    if profiler:
+        return profiler.respond(order, schemas.OrderResponse)
+    return encoding.encode_response(request, order)
 
 #faz atualização no pedido
 @app.put("/orders/{order_id}", response_model=schemas.OrderResponse)
@@ -488,13 +642,17 @@ async def delete_order(
             )
         
         # Devolve os itens ao estoque
+        stock_events = []
         for item in order.items:
             product = db.query(models.Products).filter(models.Products.id == item.product_id).first()
             if product:
                 product.stock += item.quantity
+                stock_events.append(product_event("stock", product))
         db_status = convert_order_status(models.OrderStatus.CANCELLED.value)
         order.status = db_status
         db.commit()
+        for event in stock_events:
+            broker.publish(event)
     
         return {"message": "Pedido cancelado com sucesso"}
     
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Date, func, Enum, Numeric
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Date, func, Enum, Numeric, Sequence, BigInteger, Text, text, Index
 from sqlalchemy.dialects.postgresql import ARRAY, BIGINT, JSONB
 from sqlalchemy.orm import relationship
 from database import Base
@@ -17,6 +17,12 @@ class Users(Base): #tabela que regista os usuários.
     is_superuser = Column(Boolean, default=False)
 
 
+#sequências de alteração usadas na sincronização incremental (cada insert/update recebe o próximo valor)
+clients_change_seq = Sequence("clients_change_seq", metadata=Base.metadata)
+products_change_seq = Sequence("products_change_seq", metadata=Base.metadata)
+#id da transação que gravou a linha (Postgres 13+); define até onde a sincronização pode avançar
+CURRENT_XID = "pg_current_xact_id()::text::bigint"
+
 class Clients(Base): #tabela que registra os clientes
     __tablename__ = "clients"
 
@@ -28,7 +34,10 @@ class Clients(Base): #tabela que registra os clientes
     company = Column(String(100))
     address = Column(String(200))
     is_active = Column(Boolean, default=True)
-    last_update = Column(DateTime(timezone=True), onupdate=func.now())
+    last_update = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now())
+    change_seq = Column(BigInteger, clients_change_seq, server_default=clients_change_seq.next_value(),
+                        onupdate=clients_change_seq.next_value())
+    change_xid = Column(BigInteger, server_default=text(CURRENT_XID), onupdate=text(CURRENT_XID))
 
 class Products(Base): #tabela que registra os produtos
     __tablename__ = "products"
@@ -41,9 +50,15 @@ class Products(Base): #tabela que registra os produtos
     stock = Column(Integer, nullable=False)
     expiry_date = Column(Date, nullable=True) 
     is_active = Column(Boolean, default=True)
-    last_update = Column(DateTime(timezone=True), onupdate=func.now())
+    last_update = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now())
+    change_seq = Column(BigInteger, products_change_seq, server_default=products_change_seq.next_value(),
+                        onupdate=products_change_seq.next_value())
+    change_xid = Column(BigInteger, server_default=text(CURRENT_XID), onupdate=text(CURRENT_XID))
     image_URL = Column(String(200), nullable=True)
 
+Index("ix_clients_change", Clients.change_xid, Clients.change_seq)
+Index("ix_products_change", Products.change_xid, Products.change_seq)
+
 #tabelas para organizar os pedidos
 class OrderStatus(PyEnum):
     PENDING = "pendente"
@@ -65,6 +80,7 @@ class Order(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     total_amount = Column(Numeric(10, 2))
+    snapshot = Column(Text, nullable=True) #resposta do pedido já serializada, sem id e status
     
     items = relationship("OrderItem", back_populates="order")
     client = relationship("Clients")
@@ -81,9 +97,23 @@ class OrderItem(Base):
     order = relationship("Order", back_populates="items")
     product = relationship("Products", lazy="joined")
 
- 
-    
-
-
 
+#colunas adicionadas depois da criação das tabelas; create_all não altera tabelas existentes
+SCHEMA_UPGRADES = [
+    "CREATE SEQUENCE IF NOT EXISTS clients_change_seq",
+    "CREATE SEQUENCE IF NOT EXISTS products_change_seq",
+    "ALTER TABLE clients ADD COLUMN IF NOT EXISTS change_seq BIGINT DEFAULT nextval('clients_change_seq')",
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS change_seq BIGINT DEFAULT nextval('products_change_seq')",
+    f"ALTER TABLE clients ADD COLUMN IF NOT EXISTS change_xid BIGINT DEFAULT {CURRENT_XID}",
+    f"ALTER TABLE products ADD COLUMN IF NOT EXISTS change_xid BIGINT DEFAULT {CURRENT_XID}",
+    "CREATE INDEX IF NOT EXISTS ix_clients_change ON clients (change_xid, change_seq)",
+    "CREATE INDEX IF NOT EXISTS ix_products_change ON products (change_xid, change_seq)",
+    "ALTER TABLE orders ADD COLUMN IF NOT EXISTS snapshot TEXT",
+]
 
+#cria as tabelas e aplica as alterações de schema pendentes
+def create_schema(engine):
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for statement in SCHEMA_UPGRADES:
+            conn.execute(text(statement))
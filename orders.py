@@ -0,0 +1,124 @@
+import argparse
+import json
+from datetime import datetime
+from fastapi import HTTPException
+from sqlalchemy.orm import Session, selectinload
+import models, schemas
+from auth import convert_order_status
+from events import product_event
+
+
+#Serializa a parte imutável da resposta do pedido. id e status ficam de fora:
+#o id é a chave da leitura e o status é o único campo que muda depois da criação.
+def build_snapshot(order: models.Order) -> str:
+    return schemas.OrderSnapshot.model_validate(order, from_attributes=True).model_dump_json()
+
+#Monta a resposta do pedido a partir do snapshot, encaixando o id e o status atuais.
+def snapshot_response(order_id: int, status: models.OrderStatus, snapshot: str) -> dict:
+    return {"id": order_id, "status": status.value, **json.loads(snapshot)}
+
+def order_response(order: models.Order) -> dict:
+    return snapshot_response(order.id, order.status, order.snapshot)
+
+
+#Converte linhas (id, status, snapshot) em respostas, na mesma ordem. Pedidos
+#ainda sem snapshot (anteriores ao backfill) são carregados pelo caminho antigo.
+def responses_from_rows(db: Session, rows) -> list:
+    missing = [row.id for row in rows if row.snapshot is None]
+    fallback = {}
+    if missing:
+        for order in db.query(models.Order).options(selectinload(models.Order.items)).filter(models.Order.id.in_(missing)):
+            fallback[order.id] = schemas.OrderResponse.model_validate(order, from_attributes=True).model_dump(mode="json")
+    return [
+        fallback[row.id] if row.snapshot is None else snapshot_response(row.id, row.status, row.snapshot)
+        for row in rows
+    ]
+
+def snapshot_query(db: Session):
+    return db.query(models.Order.id, models.Order.status, models.Order.snapshot)
+
+
+#Lock de todos os produtos em uma consulta, sempre na mesma ordem (por id) para
+#evitar deadlock entre transações que travam conjuntos de produtos diferentes.
+def lock_products(db: Session, product_ids) -> dict:
+    return {
+        p.id: p for p in db.query(models.Products)
+        .filter(models.Products.id.in_(sorted(set(product_ids))))
+        .order_by(models.Products.id)
+        .with_for_update()
+        .all()
+    }
+
+
+#Aplica um pedido na sessão: trava os produtos, confere o estoque, cria o pedido
+#com os itens e baixa o estoque. Não faz commit; retorna o pedido e os eventos
+#de estoque para serem publicados depois do commit.
+def place_order(db: Session, order_data: schemas.OrderCreate):
+    product_ids = sorted({item.product_id for item in order_data.items})
+    products = lock_products(db, product_ids)
+
+    db_status = convert_order_status(order_data.status)
+    order = models.Order(client_id=order_data.client_id, status=db_status, created_at=datetime.utcnow())
+    total_amount = 0
+
+    for item in order_data.items:
+        product = products.get(item.product_id)
+        if product is None:
+            raise HTTPException(status_code=404, detail=f"Produto não encontrado: {item.product_id}")
+        if product.stock < item.quantity:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Estoque insuficiente: {product.desc}"
+            )
+
+        total_amount += product.sales_price * item.quantity
+        product.stock -= item.quantity
+        order.items.append(models.OrderItem(
+            product_id=product.id,
+            quantity=item.quantity,
+            unit_price=product.sales_price
+        ))
+
+    order.total_amount = total_amount
+    order.snapshot = build_snapshot(order)  # gravado no mesmo INSERT do pedido
+    db.add(order)
+    db.flush()  # Obtém ID do pedido
+    return order, [product_event("stock", products[pid]) for pid in product_ids]
+
+
+#Preenche o snapshot dos pedidos criados antes dele existir, em lotes.
+def backfill_snapshots(db: Session, batch_size: int = 500) -> int:
+    total = 0
+    last_id = 0
+    while True:
+        batch = (
+            db.query(models.Order)
+            .options(selectinload(models.Order.items))
+            .filter(models.Order.snapshot.is_(None), models.Order.id > last_id)
+            .order_by(models.Order.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not batch:
+            return total
+        for order in batch:
+            order.snapshot = build_snapshot(order)
+        last_id = batch[-1].id
+        total += len(batch)
+        db.commit()
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Manutenção de pedidos.")
+    parser.add_argument("command", choices=["backfill-snapshots"])
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        count = backfill_snapshots(db, args.batch_size)
+        print(f"{count} pedidos com snapshot preenchido")
+    finally:
+        db.close()
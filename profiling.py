@@ -0,0 +1,153 @@
+import cProfile
+import io
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from fastapi import Depends, HTTPException, Request
+from fastapi.responses import JSONResponse
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from database import engine
+from auth import oauth2_scheme, get_current_user, get_current_superuser, get_db
+
+
+# Profiling sob demanda de uma única requisição. Ativado pelo header
+# "X-Profile: 1" (ou "X-Profile: tree" para incluir a árvore de chamadas do
+# cProfile) e permitido apenas para superusers. Sem o header nada é
+# registrado no engine: o custo é só a leitura do header.
+#
+# O cProfile mede a thread do event loop inteira, inclusive outras corrotinas
+# que rodam enquanto a requisição espera, e só um perfil pode estar ativo por
+# vez. Por isso o modo "tree" é serializado: um segundo pedido simultâneo
+# recebe 409 em vez de derrubar o primeiro.
+PROFILE_HEADER = "X-Profile"
+CALL_TREE_LINES = 40
+
+_call_tree_lock = threading.Lock()
+
+_current: ContextVar = ContextVar("request_profiler", default=None)
+_active_profilers = 0
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("profile_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profiler = _current.get()
+    if profiler is not None:
+        elapsed = time.perf_counter() - conn.info["profile_start"].pop()
+        profiler.record_query(statement, parameters, elapsed)
+
+def _attach_listeners():
+    global _active_profilers
+    if _active_profilers == 0:
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    _active_profilers += 1
+
+def _detach_listeners():
+    global _active_profilers
+    _active_profilers -= 1
+    if _active_profilers == 0:
+        event.remove(engine, "before_cursor_execute", _before_cursor_execute)
+        event.remove(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class RequestProfiler:
+    def __init__(self, call_tree: bool = False):
+        self.started = time.perf_counter()
+        self.queries = []
+        self.stages = {}
+        self.current_stage = "handler"
+        self.profile = cProfile.Profile() if call_tree else None
+
+    def record_query(self, statement, parameters, elapsed: float):
+        self.queries.append({
+            "statement": statement,
+            "parameters": repr(parameters),
+            "stage": self.current_stage,
+            "ms": round(elapsed * 1000, 3),
+        })
+
+    @contextmanager
+    def stage(self, name: str):
+        previous, self.current_stage = self.current_stage, name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+            self.current_stage = previous
+
+    def report(self) -> dict:
+        if self.profile:
+            self.profile.disable()
+        total_ms = (time.perf_counter() - self.started) * 1000
+        db_ms = sum(q["ms"] for q in self.queries)
+
+        # tempo de cada etapa sem o SQL executado dentro dela (ex.: lazy load dos itens)
+        breakdown = {"db_ms": round(db_ms, 3)}
+        for name, seconds in self.stages.items():
+            stage_db = sum(q["ms"] for q in self.queries if q["stage"] == name)
+            breakdown[f"{name}_ms"] = round(seconds * 1000 - stage_db, 3)
+        breakdown["other_ms"] = round(total_ms - sum(breakdown.values()), 3)
+
+        result = {
+            "total_ms": round(total_ms, 3),
+            "breakdown": breakdown,
+            "query_count": len(self.queries),
+            "queries": self.queries,
+        }
+        if self.profile:
+            out = io.StringIO()
+            pstats.Stats(self.profile, stream=out).sort_stats("cumulative").print_stats(CALL_TREE_LINES)
+            result["call_tree"] = out.getvalue()
+        return result
+
+    # valida e serializa a resposta medindo cada etapa, e devolve junto o relatório
+    def respond(self, result, schema):
+        with self.stage("validation"):
+            if isinstance(result, list):
+                validated = [schema.model_validate(item, from_attributes=True) for item in result]
+            else:
+                validated = schema.model_validate(result, from_attributes=True)
+        with self.stage("serialization"):
+            if isinstance(validated, list):
+                data = [item.model_dump(mode="json") for item in validated]
+            else:
+                data = validated.model_dump(mode="json")
+        return JSONResponse({"data": data, "profile": self.report()})
+
+
+# Dependência das rotas que aceitam profiling. Retorna None quando o header não
+# foi enviado; com o header, exige um superuser via get_current_superuser.
+async def get_request_profiler(request: Request, db: Session = Depends(get_db)):
+    mode = request.headers.get(PROFILE_HEADER)
+    if not mode:
+        yield None
+        return
+
+    token = await oauth2_scheme(request)
+    user = await get_current_user(token, db)
+    await get_current_superuser(user)
+
+    call_tree = mode.lower() == "tree"
+    if call_tree and not _call_tree_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="Já existe um profiling com árvore de chamadas em andamento, tente novamente")
+
+    profiler = RequestProfiler(call_tree=call_tree)
+    _current.set(profiler)
+    _attach_listeners()
+    try:
+        if profiler.profile:
+            profiler.profile.enable()
+        yield profiler
+    finally:
+        if profiler.profile:
+            profiler.profile.disable()
+            _call_tree_lock.release()
+        _detach_listeners()
+        _current.set(None)
@@ -51,19 +51,40 @@ class ClientBase(BaseModel):
     company: str
     
 
+#normaliza o CPF para o formato 000.000.000-00
+def normalize_cpf(v: str) -> str:
+    # Remove caracteres não numéricos
+    cpf = re.sub(r'[^0-9]', '', v)
+    
+    if len(cpf) != 11:
+        raise ValueError('CPF deve ter 11 dígitos')
+    
+    # Formata o CPF
+    return f'{cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:]}'
+
 class ClientCreate(ClientBase):
     cpf: str
     
     @validator('cpf')
     def validate_cpf(cls, v):
-        # Remove caracteres não numéricos
-        cpf = re.sub(r'[^0-9]', '', v)
-        
-        if len(cpf) != 11:
-            raise ValueError('CPF deve ter 11 dígitos')
-        
-        # Formata o CPF
-        return f'{cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:]}'
+        return normalize_cpf(v)
+
+#linha da importação em massa: limita os campos ao tamanho das colunas, para que
+#um valor grande vire erro da linha em vez de derrubar o INSERT do lote inteiro
+class ClientImport(ClientCreate):
+    name: str = Field(..., max_length=100)
+    phone: str = Field(..., max_length=20)
+    address: str | None = Field(None, max_length=200)
+    company: str = Field(..., max_length=100)
+
+#resultado de cada linha da importação em massa de clientes
+class ClientImportResult(BaseModel):
+    line: int
+    status: str  # created | duplicate | error
+    id: Optional[int] = None
+    email: Optional[str] = None
+    cpf: Optional[str] = None
+    detail: Optional[str] = None
 
 class Client(ClientBase):
     id: int
@@ -74,6 +95,16 @@ class Client(ClientBase):
     class Config:
         from_attributes = True   
 
+class ClientBatch(BaseModel):
+    items: List[Client]
+    missing: List[int]
+
+class ClientChanges(BaseModel):
+    upserts: List[Client]
+    deleted: List[int]
+    next_token: str
+    has_more: bool
+
 class ProductBase(BaseModel):
     name:str = Field(..., max_length=100)
     desc: str = Field(..., max_length=200)
@@ -109,6 +140,16 @@ class Product(ProductBase):
     class Config:
         from_attributes = True
 
+class ProductBatch(BaseModel):
+    items: List[Product]
+    missing: List[int]
+
+class ProductChanges(BaseModel):
+    upserts: List[Product]
+    deleted: List[int]
+    next_token: str
+    has_more: bool
+
 class ProductUpdate(BaseModel):
     desc: Optional[str] = Field(None, max_length=200)
     sales_price: Optional[int] = Field(None, ge=0)
@@ -147,6 +188,16 @@ class OrderItemResponse(BaseModel):
 
     
 
+#parte imutável da resposta do pedido, gravada junto com ele na criação
+class OrderSnapshot(BaseModel):
+    client_id: int
+    created_at: datetime
+    total_amount: float
+    items: List[OrderItemResponse]
+
+    class Config:
+        from_attributes = True
+
 class OrderResponse(BaseModel):
     id: int
     client_id: int
@@ -158,5 +209,9 @@ class OrderResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class OrderBatch(BaseModel):
+    items: List[OrderResponse]
+    missing: List[int]
+
 class OrderUpdate(BaseModel):
     status: Optional[OrderStatusEnum] = None 
\ No newline at end of file
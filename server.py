@@ -0,0 +1,213 @@
+import logging
+import os
+import random
+import signal
+import socket
+import sys
+import time
+import uvicorn
+
+
+# Servidor de produção com vários processos (prefork).
+# O processo pai faz uma única vez o trabalho de inicialização (criação/checagem
+# das tabelas, importação do app e montagem do schema OpenAPI), abre o socket e
+# só então cria os workers com fork, que herdam tudo pronto. O pai supervisiona:
+# recria workers que saem (inclusive os reciclados por MAX_REQUESTS) e, no
+# SIGTERM, repassa o sinal e espera os workers terminarem as requisições em
+# andamento até GRACEFUL_TIMEOUT.
+#
+# Configuração por variáveis de ambiente:
+#   HOST, PORT                 endereço (0.0.0.0:8000)
+#   WEB_CONCURRENCY            número de workers (padrão: CPUs disponíveis)
+#   MAX_REQUESTS               recicla o worker depois de N requisições (0 desliga)
+#   MAX_REQUESTS_JITTER        variação aleatória para os workers não reciclarem juntos
+#   GRACEFUL_TIMEOUT           segundos para drenar requisições no desligamento
+#   KEEPALIVE_TIMEOUT          keep-alive HTTP em segundos
+#   LOG_LEVEL                  nível de log do uvicorn
+#   DB_INIT                    "0" pula a criação das tabelas na inicialização
+#   EVENTS_FANOUT              eventos SSE entre workers via LISTEN/NOTIFY (padrão: ligado com mais de 1 worker)
+logger = logging.getLogger("lu_store.server")
+
+
+def available_cpus() -> int:
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    # limite de CPU do container (cgroup v2), ex.: docker run --cpus=2
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def fastest_loop() -> str:
+    try:
+        import uvloop  # noqa: F401
+        return "uvloop"
+    except ImportError:
+        return "asyncio"
+
+def fastest_http() -> str:
+    try:
+        import httptools  # noqa: F401
+        return "httptools"
+    except ImportError:
+        return "h11"
+
+
+class Settings:
+    def __init__(self):
+        self.host = os.getenv("HOST", "0.0.0.0")
+        self.port = int(os.getenv("PORT", 8000))
+        self.workers = int(os.getenv("WEB_CONCURRENCY", 0)) or available_cpus()
+        self.max_requests = int(os.getenv("MAX_REQUESTS", 0))
+        self.max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", 0))
+        self.graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", 30))
+        self.keepalive_timeout = int(os.getenv("KEEPALIVE_TIMEOUT", 5))
+        self.log_level = os.getenv("LOG_LEVEL", "info")
+        self.db_init = os.getenv("DB_INIT", "1") == "1"
+        self.loop = fastest_loop()
+        self.http = fastest_http()
+
+
+# Trabalho feito uma vez no pai, antes do fork.
+def startup(settings: Settings):
+    import models
+    from database import engine
+
+    if settings.db_init:
+        models.create_schema(engine)
+    # os workers herdam o app importado; não precisam repetir o create_all
+    os.environ["DB_INIT"] = "0"
+    # limits.py divide os limites de admissão pelo número real de workers
+    os.environ["WEB_CONCURRENCY"] = str(settings.workers)
+    # cada worker tem seus assinantes SSE; com mais de um, os eventos passam pelo Postgres
+    if settings.workers > 1:
+        os.environ.setdefault("EVENTS_FANOUT", "1")
+
+    import main
+    main.app.openapi()
+    # conexões abertas no pai não podem ser compartilhadas com os filhos
+    engine.dispose()
+    return main.app
+
+
+def bind_socket(settings: Settings) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in settings.host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((settings.host, settings.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock: socket.socket, settings: Settings):
+    for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+        signal.signal(sig, signal.SIG_DFL)
+    max_requests = None
+    if settings.max_requests:
+        max_requests = settings.max_requests + random.randint(0, settings.max_requests_jitter)
+    config = uvicorn.Config(
+        app,
+        loop=settings.loop,
+        http=settings.http,
+        lifespan="on",
+        log_level=settings.log_level,
+        limit_max_requests=max_requests,
+        timeout_keep_alive=settings.keepalive_timeout,
+        timeout_graceful_shutdown=settings.graceful_timeout,
+    )
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Supervisor:
+    def __init__(self, app, sock: socket.socket, settings: Settings):
+        self.app = app
+        self.sock = sock
+        self.settings = settings
+        self.workers = set()
+        self.stopping = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.app, self.sock, self.settings)
+            except BaseException:
+                logger.exception("Worker %s falhou", os.getpid())
+                code = 1
+            finally:
+                os._exit(code)
+        self.workers.add(pid)
+        logger.info("Worker %s iniciado", pid)
+
+    def stop(self, signum, frame):
+        if self.stopping:
+            return
+        self.stopping = True
+        logger.info("Desligando: drenando %s workers", len(self.workers))
+        for pid in self.workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def reap(self) -> bool:
+        reaped = False
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.workers.clear()
+                break
+            if pid == 0:
+                break
+            self.workers.discard(pid)
+            reaped = True
+            logger.info("Worker %s saiu (status %s)", pid, status)
+        return reaped
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(self.settings.workers):
+            self.spawn()
+
+        while not self.stopping:
+            self.reap()
+            # recria workers reciclados ou que caíram
+            while not self.stopping and len(self.workers) < self.settings.workers:
+                self.spawn()
+                time.sleep(0.1)
+            time.sleep(0.5)
+
+        deadline = time.monotonic() + self.settings.graceful_timeout
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in self.workers:
+            logger.warning("Worker %s não terminou a tempo, encerrando", pid)
+            os.kill(pid, signal.SIGKILL)
+        self.sock.close()
+
+
+def main():
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "info").upper(), format="%(asctime)s %(name)s %(message)s")
+    settings = Settings()
+    logger.info(
+        "Iniciando %s workers em %s:%s (loop=%s, http=%s)",
+        settings.workers, settings.host, settings.port, settings.loop, settings.http,
+    )
+    app = startup(settings)
+    sock = bind_socket(settings)
+    Supervisor(app, sock, settings).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
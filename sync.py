@@ -0,0 +1,54 @@
+from fastapi import HTTPException
+from sqlalchemy import select, text, tuple_
+from sqlalchemy.orm import Session
+
+
+# Sincronização incremental por token de alteração. Todo insert/update em
+# products/clients grava o id da transação (change_xid) e o próximo valor da
+# sequência da tabela (change_seq). O token devolvido ao terminal é o par
+# "xid.seq" até onde tudo já foi entregue; na reconexão ele envia o token e
+# recebe só o que mudou depois: registros ativos como upserts e os
+# desativados (soft delete) como deleted.
+# Um valor de sequência é reservado antes do commit, então transações
+# concorrentes ficam visíveis fora da ordem da sequência. Por isso só são
+# entregues linhas gravadas por transações mais antigas que o xmin do snapshot
+# atual (todas já terminaram) e o token nunca passa desse ponto: o que ainda
+# estava em andamento aparece na próxima sincronização.
+MAX_PAGE_SIZE = 1000
+
+
+def parse_token(token: str | None) -> tuple:
+    if not token:
+        return 0, 0
+    try:
+        xid, seq = (int(part) for part in token.split("."))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Token de sincronização inválido")
+    if xid < 0 or seq < 0:
+        raise HTTPException(status_code=400, detail="Token de sincronização inválido")
+    return xid, seq
+
+
+def changes_since(db: Session, model, token: str | None, limit: int) -> dict:
+    since = parse_token(token)
+    # lido antes das linhas: toda transação abaixo dele já terminou e está visível na consulta seguinte
+    watermark = db.scalar(select(text("pg_snapshot_xmin(pg_current_snapshot())::text::bigint")))
+    rows = (
+        db.query(model)
+        .filter(tuple_(model.change_xid, model.change_seq) > tuple_(*since), model.change_xid < watermark)
+        .order_by(model.change_xid, model.change_seq)
+        .limit(limit + 1)
+        .all()
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if has_more:
+        next_token = (rows[-1].change_xid, rows[-1].change_seq)
+    else:
+        next_token = max(since, (watermark, 0))
+    return {
+        "upserts": [row for row in rows if row.is_active],
+        "deleted": [row.id for row in rows if not row.is_active],
+        "next_token": f"{next_token[0]}.{next_token[1]}",
+        "has_more": has_more,
+    }
@@ -0,0 +1,223 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+
+import group_commit
+from group_commit import GroupCommitter
+
+
+# Sessão falsa: registra savepoints, commits e rollbacks. fail_commit decide,
+# a cada commit, se ele deve falhar (recebe os pedidos aplicados na sessão).
+class FakeSession:
+    def __init__(self, log, fail_commit=None):
+        self.log = log
+        self.fail_commit = fail_commit
+        self.applied = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.closed = False
+
+    def begin_nested(self):
+        session = self
+
+        class Savepoint:
+            def commit(self):
+                pass
+
+            def rollback(self):
+                session.applied.pop()
+
+        return Savepoint()
+
+    def commit(self):
+        if self.fail_commit and self.fail_commit(self.applied):
+            raise RuntimeError("commit falhou")
+        self.commits += 1
+        self.log.extend(self.applied)
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+def order(tag, *product_ids):
+    return SimpleNamespace(tag=tag, items=[SimpleNamespace(product_id=p) for p in product_ids])
+
+
+@pytest.fixture
+def committed(monkeypatch):
+    log = []
+    locks = []
+
+    def place_order(db, order_data):
+        db.applied.append(order_data.tag)
+        if order_data.tag.startswith("sem-estoque"):
+            raise HTTPException(status_code=400, detail="Estoque insuficiente")
+        return SimpleNamespace(tag=order_data.tag), [f"stock:{order_data.tag}"]
+
+    monkeypatch.setattr(group_commit, "place_order", place_order)
+    monkeypatch.setattr(group_commit, "order_response", lambda o: {"tag": o.tag})
+    monkeypatch.setattr(group_commit, "lock_products", lambda db, ids: locks.append(list(ids)))
+    return SimpleNamespace(log=log, locks=locks)
+
+
+def make_committer(committed, sessions, fail_commit=None, **kwargs):
+    def factory():
+        session = FakeSession(committed.log, fail_commit)
+        sessions.append(session)
+        return session
+    return GroupCommitter(session_factory=factory, **kwargs)
+
+
+def test_partial_failure_only_fails_its_order(committed):
+    sessions = []
+    committer = make_committer(committed, sessions)
+    batch = [(order(tag, 1), Future()) for tag in ("a", "sem-estoque", "b")]
+
+    committer._apply(batch)
+
+    assert batch[0][1].result() == ({"tag": "a"}, ["stock:a"])
+    with pytest.raises(HTTPException):
+        batch[1][1].result()
+    assert batch[2][1].result() == ({"tag": "b"}, ["stock:b"])
+    assert committed.log == ["a", "b"]
+    assert len(sessions) == 1 and sessions[0].commits == 1 and sessions[0].closed
+    assert committer.snapshot()["failed"] == 1
+
+
+def test_commit_failure_retries_each_order_alone(committed):
+    sessions = []
+    # o commit falha sempre que o pedido "ruim" está na transação
+    committer = make_committer(committed, sessions, fail_commit=lambda applied: "ruim" in applied)
+    batch = [(order(tag, 1), Future()) for tag in ("a", "ruim", "b")]
+
+    committer._apply(batch)
+
+    assert batch[0][1].result()[0] == {"tag": "a"}
+    with pytest.raises(RuntimeError):
+        batch[1][1].result()
+    assert batch[2][1].result()[0] == {"tag": "b"}
+    assert committed.log == ["a", "b"]
+    # um lote que falhou e três transações de um pedido cada
+    assert len(sessions) == 4 and all(s.closed for s in sessions)
+    assert sessions[0].rollbacks == 1
+    assert committer.snapshot()["commit_failures"] == 2
+
+
+def test_locks_union_of_batch_products_before_applying(committed):
+    committer = make_committer(committed, [])
+    committer._apply([(order("a", 5, 2), Future()), (order("b", 3, 2), Future())])
+    assert sorted(committed.locks[0]) == [2, 2, 3, 5]
+
+
+def test_results_follow_their_callers_in_order(committed):
+    committer = make_committer(committed, [], window_ms=50)
+    tags = [f"p{i}" for i in range(20)]
+
+    async def main():
+        return await asyncio.gather(*(committer.place(order(tag, i)) for i, tag in enumerate(tags)))
+
+    results = asyncio.run(main())
+    assert [response["tag"] for response, _ in results] == tags
+    assert committed.log == tags
+
+
+def test_broken_session_factory_does_not_hang(committed):
+    def factory():
+        raise RuntimeError("sem conexão")
+
+    committer = GroupCommitter(session_factory=factory, window_ms=1, timeout_s=5)
+
+    async def main():
+        return await asyncio.gather(committer.place(order("a", 1)), committer.place(order("b", 1)),
+                                    return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert committer.thread.is_alive()
+
+
+def test_timeout_answers_503_and_skips_queued_order(committed):
+    release = threading.Event()
+    sessions = []
+
+    def factory():
+        release.wait()
+        session = FakeSession(committed.log)
+        sessions.append(session)
+        return session
+
+    committer = GroupCommitter(session_factory=factory, window_ms=1, max_batch=1, timeout_s=0.2)
+
+    async def main():
+        first = asyncio.ensure_future(asyncio.wrap_future(committer.submit(order("bloqueado", 1))))
+        with pytest.raises(HTTPException) as exc:
+            await committer.place(order("expirado", 1))
+        assert exc.value.status_code == 503
+        release.set()
+        await first
+
+    asyncio.run(main())
+    committer._apply([(order("depois", 1), Future())])
+    assert committed.log == ["bloqueado", "depois"]
+    assert committer.snapshot()["timeouts"] == 1
+
+
+def test_timeout_while_running_reports_unknown_outcome(committed):
+    release = threading.Event()
+
+    def factory():
+        release.wait()
+        return FakeSession(committed.log)
+
+    committer = GroupCommitter(session_factory=factory, window_ms=1, timeout_s=0.2)
+
+    async def main():
+        with pytest.raises(HTTPException) as exc:
+            await committer.place(order("em-gravacao", 1))
+        assert exc.value.status_code == 504
+        release.set()
+
+    asyncio.run(main())
+    deadline = time.monotonic() + 2
+    while not committed.log and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # o pedido foi gravado mesmo com o timeout do chamador, que não recebeu 503
+    assert committed.log == ["em-gravacao"]
+    assert committer.snapshot()["unknown_outcomes"] == 1
+
+def test_waiting_requests_do_not_hold_pool_connections(committed, monkeypatch, tmp_path):
+    # pool de uma conexão só, compartilhado entre as "requisições" e a thread escritora
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=QueuePool,
+                           pool_size=1, max_overflow=0, pool_timeout=1)
+    Session = sessionmaker(bind=engine)
+
+    def place_order(db, order_data):
+        db.execute(text("SELECT 1"))
+        db.applied = getattr(db, "applied", []) + [order_data.tag]
+        return SimpleNamespace(tag=order_data.tag), []
+
+    monkeypatch.setattr(group_commit, "place_order", place_order)
+    committer = GroupCommitter(session_factory=Session, window_ms=20, timeout_s=5)
+
+    async def request(tag):
+        db = Session()
+        db.execute(text("SELECT 1"))  # a autenticação já pegou uma conexão do pool
+        return await committer.place(order(tag, 1), db)
+
+    async def main():
+        return await asyncio.gather(*(request(f"p{i}") for i in range(8)))
+
+    results = asyncio.run(main())
+    assert [response["tag"] for response, _ in results] == [f"p{i}" for i in range(8)]
+    assert committer.snapshot()["commit_failures"] == 0